@@ -52,15 +52,21 @@ Made possible by:
 
 import argparse
 import binascii
+import codecs
+import collections
+import contextlib
 import ctypes
+import functools
 import os
 from pathlib import Path
 import plistlib
+import shutil
 import socket
 import subprocess
 import sys
 import struct
 import time
+import types
 
 # CoreFoundation.framework
 
@@ -78,6 +84,13 @@ CFGetTypeID.argtypes = [ctypes.c_void_p]
 CFGetTypeID.restype = ctypes.c_ulong
 
 CFStringRef = ctypes.c_void_p
+CFIndex = ctypes.c_ssize_t
+
+class CFRange(ctypes.Structure):
+    _fields_ = [
+        ('location', CFIndex),
+        ('length', CFIndex),
+    ]
 
 CFStringGetTypeID = CoreFoundation.CFStringGetTypeID
 CFStringGetTypeID.argtypes = []
@@ -99,7 +112,37 @@ CFNumberGetValue = CoreFoundation.CFNumberGetValue
 CFNumberGetValue.argtypes = [ctypes.c_void_p, ctypes.c_uint, ctypes.c_void_p]
 CFNumberGetValue.restype = ctypes.c_bool
 
+CFNumberGetTypeID = CoreFoundation.CFNumberGetTypeID
+CFNumberGetTypeID.argtypes = []
+CFNumberGetTypeID.restype = ctypes.c_ulong
+
+CFNumberIsFloatType = CoreFoundation.CFNumberIsFloatType
+CFNumberIsFloatType.argtypes = [ctypes.c_void_p]
+CFNumberIsFloatType.restype = ctypes.c_bool
+
 kCFNumberSInt32Type = 3
+kCFNumberSInt64Type = 4
+kCFNumberFloat64Type = 6
+
+CFBooleanGetTypeID = CoreFoundation.CFBooleanGetTypeID
+CFBooleanGetTypeID.argtypes = []
+CFBooleanGetTypeID.restype = ctypes.c_ulong
+
+CFBooleanGetValue = CoreFoundation.CFBooleanGetValue
+CFBooleanGetValue.argtypes = [ctypes.c_void_p]
+CFBooleanGetValue.restype = ctypes.c_bool
+
+CFArrayGetTypeID = CoreFoundation.CFArrayGetTypeID
+CFArrayGetTypeID.argtypes = []
+CFArrayGetTypeID.restype = ctypes.c_ulong
+
+CFArrayGetCount = CoreFoundation.CFArrayGetCount
+CFArrayGetCount.argtypes = [ctypes.c_void_p]
+CFArrayGetCount.restype = CFIndex
+
+CFArrayGetValueAtIndex = CoreFoundation.CFArrayGetValueAtIndex
+CFArrayGetValueAtIndex.argtypes = [ctypes.c_void_p, CFIndex]
+CFArrayGetValueAtIndex.restype = ctypes.c_void_p
 
 CFRunLoopRun = CoreFoundation.CFRunLoopRun
 CFRunLoopRun.argtypes = []
@@ -119,6 +162,14 @@ CFRunLoopTimerCreate = CoreFoundation.CFRunLoopTimerCreate
 CFRunLoopTimerCreate.argtypes = [ctypes.c_void_p, ctypes.c_double, ctypes.c_double, ctypes.c_uint, ctypes.c_uint, cf_run_loop_timer_callback, ctypes.c_void_p]
 CFRunLoopTimerCreate.restype = ctypes.c_void_p
 
+try:
+    CFRunLoopTimerSetTolerance = CoreFoundation.CFRunLoopTimerSetTolerance
+    CFRunLoopTimerSetTolerance.argtypes = [ctypes.c_void_p, ctypes.c_double]
+    CFRunLoopTimerSetTolerance.restype = None
+except AttributeError:
+    # Timer tolerance is missing from older CoreFoundation builds, including win32.
+    CFRunLoopTimerSetTolerance = None
+
 kCFRunLoopCommonModes = CFStringRef.in_dll(CoreFoundation, 'kCFRunLoopCommonModes')
 
 CFAbsoluteTimeGetCurrent = CoreFoundation.CFAbsoluteTimeGetCurrent
@@ -178,53 +229,153 @@ CFDataCreate = CoreFoundation.CFDataCreate
 CFDataCreate.argtypes = [ctypes.c_void_p, ctypes.c_char_p, ctypes.c_int]
 CFDataCreate.restype = ctypes.c_void_p
 
+CFDataGetTypeID = CoreFoundation.CFDataGetTypeID
+CFDataGetTypeID.argtypes = []
+CFDataGetTypeID.restype = ctypes.c_ulong
+
+CFDataGetLength = CoreFoundation.CFDataGetLength
+CFDataGetLength.argtypes = [CFDataRef]
+CFDataGetLength.restype = CFIndex
+
+CFDataGetBytePtr = CoreFoundation.CFDataGetBytePtr
+CFDataGetBytePtr.argtypes = [CFDataRef]
+CFDataGetBytePtr.restype = ctypes.c_void_p
+
 CFStringCreateWithCString = CoreFoundation.CFStringCreateWithCString
 CFStringCreateWithCString.argtypes = [ctypes.c_void_p, ctypes.c_char_p, ctypes.c_uint]
 CFStringCreateWithCString.restype = CFStringRef
 
+# CFStr results are never released, so handing out the same reference for a
+# repeated key costs nothing extra.
+@functools.lru_cache(maxsize=256)
 def CFStr(value):
     return CFStringCreateWithCString(None, value.encode('utf-8'), kCFStringEncodingUTF8)
 
 CFStringGetCStringPtr = CoreFoundation.CFStringGetCStringPtr
 CFStringGetCStringPtr.argtypes = [CFStringRef, ctypes.c_uint]
-CFStringGetCStringPtr.restype = ctypes.c_char_p
+CFStringGetCStringPtr.restype = ctypes.c_void_p
 
 CFStringGetCString = CoreFoundation.CFStringGetCString
 CFStringGetCString.argtypes = [CFStringRef, ctypes.c_char_p, ctypes.c_uint, ctypes.c_uint]
 CFStringGetCString.restype = ctypes.c_bool
 
+CFStringGetBytes = CoreFoundation.CFStringGetBytes
+CFStringGetBytes.argtypes = [CFStringRef, CFRange, ctypes.c_uint, ctypes.c_ubyte, ctypes.c_bool, ctypes.c_void_p, CFIndex, ctypes.POINTER(CFIndex)]
+CFStringGetBytes.restype = CFIndex
+
 kCFStringEncodingUTF8 = 0x08000100
 
+# Decoding straight from CoreFoundation's memory skips an intermediate bytes object.
+PyUnicode_FromString = ctypes.pythonapi.PyUnicode_FromString
+PyUnicode_FromString.argtypes = [ctypes.c_void_p]
+PyUnicode_FromString.restype = ctypes.py_object
+
+PyUnicode_DecodeUTF8 = ctypes.pythonapi.PyUnicode_DecodeUTF8
+PyUnicode_DecodeUTF8.argtypes = [ctypes.c_void_p, ctypes.c_ssize_t, ctypes.c_char_p]
+PyUnicode_DecodeUTF8.restype = ctypes.py_object
+
+# Scratch space for CFStringGetStr, grown as needed rather than allocated per call.
+_STR_BUF = ctypes.create_string_buffer(1024)
+
 def CFStringGetStr(cfstr):
-    result = None
-    if cfstr:
-        result = CFStringGetCStringPtr(cfstr, kCFStringEncodingUTF8)
-        if not result:
-            length = CFStringGetLength(cfstr) * 2 + 1
-            stringBuffer = ctypes.create_string_buffer(length)
-            CFStringGetCString(cfstr, stringBuffer, length, kCFStringEncodingUTF8)
-            result = stringBuffer.value
-    return result.decode("utf8")
+    global _STR_BUF
+    if not cfstr:
+        return None
+    pointer = CFStringGetCStringPtr(cfstr, kCFStringEncodingUTF8)
+    if pointer:
+        return PyUnicode_FromString(pointer)
+    # Ask for the exact UTF-8 size first, then convert into the shared buffer.
+    stringRange = CFRange(0, CFStringGetLength(cfstr))
+    size = CFIndex()
+    CFStringGetBytes(cfstr, stringRange, kCFStringEncodingUTF8, 0, False, None, 0, ctypes.byref(size))
+    if size.value > len(_STR_BUF):
+        _STR_BUF = ctypes.create_string_buffer(max(size.value, len(_STR_BUF) * 2))
+    CFStringGetBytes(cfstr, stringRange, kCFStringEncodingUTF8, 0, False, _STR_BUF, size.value, ctypes.byref(size))
+    return PyUnicode_DecodeUTF8(_STR_BUF, size.value, None)
+
+# Free (keys, values) array pairs for CFDictionaryToDict, indexed by size.  A
+# pair is only handed out to one call at a time, so recursing into nested
+# dictionaries is safe.
+_VOID_P_ARRAY_POOL = {}
 
 def CFDictionaryToDict(dictionary):
     count = CFDictionaryGetCount(dictionary)
-    keys = (ctypes.c_void_p * count)()
-    values = (ctypes.c_void_p * count)()
-    CFDictionaryGetKeysAndValues(dictionary, keys, values)
-    keys = [CFToPython(key) for key in keys]
-    values = [CFToPython(value) for value in values]
-    return dict(list(zip(keys, values)))
-
-def CFToPython(dataRef):
-    typeId = CFGetTypeID(dataRef)
-    if typeId == CFStringGetTypeID():
+    pool = _VOID_P_ARRAY_POOL.setdefault(count, [])
+    arrays = pool.pop() if pool else ((ctypes.c_void_p * count)(), (ctypes.c_void_p * count)())
+    keys, values = arrays
+    try:
+        CFDictionaryGetKeysAndValues(dictionary, keys, values)
+        # Nearly every key and most values are strings, so decode those inline
+        # rather than going through CFToPython.
+        result = {}
+        for i in range(count):
+            key = keys[i]
+            typeId = CFGetTypeID(key)
+            key = CFStringGetStr(key) if typeId == _CFSTRING_TYPE_ID else CFToPython(key, typeId)
+            value = values[i]
+            typeId = CFGetTypeID(value)
+            result[key] = CFStringGetStr(value) if typeId == _CFSTRING_TYPE_ID else CFToPython(value, typeId)
+        return result
+    finally:
+        pool.append(arrays)
+
+# Type IDs are fixed for the life of the process.
+_CFSTRING_TYPE_ID = CFStringGetTypeID()
+_CFDICTIONARY_TYPE_ID = CFDictionaryGetTypeID()
+_CFNUMBER_TYPE_ID = CFNumberGetTypeID()
+_CFBOOLEAN_TYPE_ID = CFBooleanGetTypeID()
+_CFDATA_TYPE_ID = CFDataGetTypeID()
+_CFARRAY_TYPE_ID = CFArrayGetTypeID()
+
+def CFToPython(dataRef, typeId=None):
+    if typeId is None:
+        typeId = CFGetTypeID(dataRef)
+    if typeId == _CFSTRING_TYPE_ID:
         return CFStringGetStr(dataRef)
-    elif typeId == CFDictionaryGetTypeID():
+    elif typeId == _CFDICTIONARY_TYPE_ID:
         return CFDictionaryToDict(dataRef)
+    elif typeId == _CFNUMBER_TYPE_ID:
+        if CFNumberIsFloatType(dataRef):
+            number = ctypes.c_double()
+            CFNumberGetValue(dataRef, kCFNumberFloat64Type, ctypes.byref(number))
+        else:
+            number = ctypes.c_int64()
+            CFNumberGetValue(dataRef, kCFNumberSInt64Type, ctypes.byref(number))
+        return number.value
+    elif typeId == _CFBOOLEAN_TYPE_ID:
+        return CFBooleanGetValue(dataRef)
+    elif typeId == _CFDATA_TYPE_ID:
+        return ctypes.string_at(CFDataGetBytePtr(dataRef), CFDataGetLength(dataRef))
+    elif typeId == _CFARRAY_TYPE_ID:
+        return [CFToPython(CFArrayGetValueAtIndex(dataRef, i)) for i in range(CFArrayGetCount(dataRef))]
     else:
         description = CFCopyDescription(dataRef)
         return CFStringGetStr(description)
 
+# Option dictionaries are built from the same few literals on every call, so
+# hand back the same CFDictionary for the same contents.
+_CFDICT_CACHE = {}
+
+def CFDict(value):
+    cacheKey = frozenset(value.items())
+    dictionary = _CFDICT_CACHE.get(cacheKey)
+    if dictionary is None:
+        count = len(value)
+        keys = (ctypes.c_void_p * count)(*[CFStr(key) for key in value.keys()])
+        values = (ctypes.c_void_p * count)(*[CFStr(item) for item in value.values()])
+        dictionary = CFDictionaryCreate(None, keys, values, count, ctypes.byref(kCFTypeDictionaryKeyCallBacks), ctypes.byref(kCFTypeDictionaryValueCallBacks))
+        _CFDICT_CACHE[cacheKey] = dictionary
+    return dictionary
+
+# Keys looked up on every status callback or device query.
+_CFSTR_PRODUCT_VERSION = CFStr('ProductVersion')
+_CFSTR_BUILD_VERSION = CFStr('BuildVersion')
+_CFSTR_PERCENT_COMPLETE = CFStr('PercentComplete')
+_CFSTR_STATUS = CFStr('Status')
+_CFSTR_PATH = CFStr('Path')
+
+_INSTALL_OPTIONS = CFDict({'PackageType': 'Developer'})
+
 # MobileDevice.Framework
 
 if sys.platform == 'win32':
@@ -236,7 +387,9 @@ AMDSetLogLevel = MobileDevice.AMDSetLogLevel
 AMDSetLogLevel.argtypes = [ctypes.c_int]
 AMDSetLogLevel.restype = None
 
-AMDSetLogLevel(5)
+# Verbose MobileDevice logging slows down large transfers, so only errors are
+# logged unless APPLE_PY_LOG_LEVEL asks for more (5 is the most verbose).
+AMDSetLogLevel(int(os.environ.get('APPLE_PY_LOG_LEVEL', '1')))
 
 am_device_p = ctypes.c_void_p
 
@@ -340,6 +493,13 @@ AMDServiceConnectionGetSocket = MobileDevice.AMDServiceConnectionGetSocket
 AMDServiceConnectionGetSocket.argtypes = [ctypes.c_void_p]
 AMDServiceConnectionGetSocket.restype = ctypes.c_uint
 
+try:
+    AMDServiceConnectionGetSecureIOContext = MobileDevice.AMDServiceConnectionGetSecureIOContext
+    AMDServiceConnectionGetSecureIOContext.argtypes = [ctypes.c_void_p]
+    AMDServiceConnectionGetSecureIOContext.restype = ctypes.c_void_p
+except AttributeError:
+    AMDServiceConnectionGetSecureIOContext = None
+
 AMDServiceConnectionInvalidate = MobileDevice.AMDServiceConnectionInvalidate
 AMDServiceConnectionInvalidate.argtypes = [ctypes.c_void_p]
 AMDServiceConnectionInvalidate.restype = None
@@ -349,8 +509,8 @@ AMDServiceConnectionSend.argtypes = [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_
 AMDServiceConnectionSend.restype = ctypes.c_int32
 
 AMDServiceConnectionReceive = MobileDevice.AMDServiceConnectionReceive
-AMDServiceConnectionSend.argtypes = [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_uint32]
-AMDServiceConnectionSend.restype = ctypes.c_int32
+AMDServiceConnectionReceive.argtypes = [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_uint32]
+AMDServiceConnectionReceive.restype = ctypes.c_int32
 
 am_device_install_application_callback = ctypes.CFUNCTYPE(ctypes.c_uint, CFDictionaryRef, ctypes.c_void_p)
 
@@ -375,6 +535,9 @@ AMDeviceLookupApplications.restype = ctypes.c_uint
 AFCConnectionRef = ctypes.c_void_p
 AFCFileRef = ctypes.c_uint64
 
+# Every AFC request is a round trip to the device, so move data in large chunks.
+AFC_CHUNK_SIZE = 1 << 20
+
 AFCConnectionOpen = MobileDevice.AFCConnectionOpen
 AFCConnectionOpen.argtypes = [ctypes.c_int, ctypes.c_uint, ctypes.POINTER(AFCConnectionRef)]
 AFCConnectionOpen.restype = ctypes.c_uint
@@ -417,300 +580,320 @@ AFCDirectoryClose = MobileDevice.AFCDirectoryClose
 AFCDirectoryClose.argtypes = [AFCConnectionRef, AFCDirectoryRef]
 AFCDirectoryClose.restype = ctypes.c_uint
 
-def _get_mobile_device_error(error_code):
-    # Sourced this list from https://github.com/ios-control/ios-deploy
-    _error_code_to_message = {
-        0x00000000: "kAMDSuccess",
-        0xe8000001: "kAMDUndefinedError",
-        0xe8000002: "kAMDBadHeaderError",
-        0xe8000003: "kAMDNoResourcesError",
-        0xe8000004: "kAMDReadError",
-        0xe8000005: "kAMDWriteError",
-        0xe8000006: "kAMDUnknownPacketError",
-        0xe8000007: "kAMDInvalidArgumentError",
-        0xe8000008: "kAMDNotFoundError",
-        0xe8000009: "kAMDIsDirectoryError",
-        0xe800000a: "kAMDPermissionError",
-        0xe800000b: "kAMDNotConnectedError",
-        0xe800000c: "kAMDTimeOutError",
-        0xe800000d: "kAMDOverrunError",
-        0xe800000e: "kAMDEOFError",
-        0xe800000f: "kAMDUnsupportedError",
-        0xe8000010: "kAMDFileExistsError",
-        0xe8000011: "kAMDBusyError",
-        0xe8000012: "kAMDCryptoError",
-        0xe8000013: "kAMDInvalidResponseError",
-        0xe8000014: "kAMDMissingKeyError",
-        0xe8000015: "kAMDMissingValueError",
-        0xe8000016: "kAMDGetProhibitedError",
-        0xe8000017: "kAMDSetProhibitedError",
-        0xe8000018: "kAMDRemoveProhibitedError",
-        0xe8000019: "kAMDImmutableValueError",
-        0xe800001a: "kAMDPasswordProtectedError",
-        0xe800001b: "kAMDMissingHostIDError",
-        0xe800001c: "kAMDInvalidHostIDError",
-        0xe800001d: "kAMDSessionActiveError",
-        0xe800001e: "kAMDSessionInactiveError",
-        0xe800001f: "kAMDMissingSessionIDError",
-        0xe8000020: "kAMDInvalidSessionIDError",
-        0xe8000021: "kAMDMissingServiceError",
-        0xe8000022: "kAMDInvalidServiceError",
-        0xe8000023: "kAMDInvalidCheckinError",
-        0xe8000024: "kAMDCheckinTimeoutError",
-        0xe8000025: "kAMDMissingPairRecordError",
-        0xe8000026: "kAMDInvalidActivationRecordError",
-        0xe8000027: "kAMDMissingActivationRecordError",
-        0xe8000028: "kAMDWrongDroidError",
-        0xe8000029: "kAMDSUVerificationError",
-        0xe800002a: "kAMDSUPatchError",
-        0xe800002b: "kAMDSUFirmwareError",
-        0xe800002c: "kAMDProvisioningProfileNotValid",
-        0xe800002d: "kAMDSendMessageError",
-        0xe800002e: "kAMDReceiveMessageError",
-        0xe800002f: "kAMDMissingOptionsError",
-        0xe8000030: "kAMDMissingImageTypeError",
-        0xe8000031: "kAMDDigestFailedError",
-        0xe8000032: "kAMDStartServiceError",
-        0xe8000033: "kAMDInvalidDiskImageError",
-        0xe8000034: "kAMDMissingDigestError",
-        0xe8000035: "kAMDMuxError",
-        0xe8000036: "kAMDApplicationAlreadyInstalledError",
-        0xe8000037: "kAMDApplicationMoveFailedError",
-        0xe8000038: "kAMDApplicationSINFCaptureFailedError",
-        0xe8000039: "kAMDApplicationSandboxFailedError",
-        0xe800003a: "kAMDApplicationVerificationFailedError",
-        0xe800003b: "kAMDArchiveDestructionFailedError",
-        0xe800003c: "kAMDBundleVerificationFailedError",
-        0xe800003d: "kAMDCarrierBundleCopyFailedError",
-        0xe800003e: "kAMDCarrierBundleDirectoryCreationFailedError",
-        0xe800003f: "kAMDCarrierBundleMissingSupportedSIMsError",
-        0xe8000040: "kAMDCommCenterNotificationFailedError",
-        0xe8000041: "kAMDContainerCreationFailedError",
-        0xe8000042: "kAMDContainerP0wnFailedError",
-        0xe8000043: "kAMDContainerRemovalFailedError",
-        0xe8000044: "kAMDEmbeddedProfileInstallFailedError",
-        0xe8000045: "kAMDErrorError",
-        0xe8000046: "kAMDExecutableTwiddleFailedError",
-        0xe8000047: "kAMDExistenceCheckFailedError",
-        0xe8000048: "kAMDInstallMapUpdateFailedError",
-        0xe8000049: "kAMDManifestCaptureFailedError",
-        0xe800004a: "kAMDMapGenerationFailedError",
-        0xe800004b: "kAMDMissingBundleExecutableError",
-        0xe800004c: "kAMDMissingBundleIdentifierError",
-        0xe800004d: "kAMDMissingBundlePathError",
-        0xe800004e: "kAMDMissingContainerError",
-        0xe800004f: "kAMDNotificationFailedError",
-        0xe8000050: "kAMDPackageExtractionFailedError",
-        0xe8000051: "kAMDPackageInspectionFailedError",
-        0xe8000052: "kAMDPackageMoveFailedError",
-        0xe8000053: "kAMDPathConversionFailedError",
-        0xe8000054: "kAMDRestoreContainerFailedError",
-        0xe8000055: "kAMDSeatbeltProfileRemovalFailedError",
-        0xe8000056: "kAMDStageCreationFailedError",
-        0xe8000057: "kAMDSymlinkFailedError",
-        0xe8000058: "kAMDiTunesArtworkCaptureFailedError",
-        0xe8000059: "kAMDiTunesMetadataCaptureFailedError",
-        0xe800005a: "kAMDAlreadyArchivedError",
-        0xe800005b: "kAMDServiceLimitError",
-        0xe800005c: "kAMDInvalidPairRecordError",
-        0xe800005d: "kAMDServiceProhibitedError",
-        0xe800005e: "kAMDCheckinSetupFailedError",
-        0xe800005f: "kAMDCheckinConnectionFailedError",
-        0xe8000060: "kAMDCheckinReceiveFailedError",
-        0xe8000061: "kAMDCheckinResponseFailedError",
-        0xe8000062: "kAMDCheckinSendFailedError",
-        0xe8000063: "kAMDMuxCreateListenerError",
-        0xe8000064: "kAMDMuxGetListenerError",
-        0xe8000065: "kAMDMuxConnectError",
-        0xe8000066: "kAMDUnknownCommandError",
-        0xe8000067: "kAMDAPIInternalError",
-        0xe8000068: "kAMDSavePairRecordFailedError",
-        0xe8000069: "kAMDCheckinOutOfMemoryError",
-        0xe800006a: "kAMDDeviceTooNewError",
-        0xe800006b: "kAMDDeviceRefNoGood",
-        0xe800006c: "kAMDCannotTranslateError",
-        0xe800006d: "kAMDMobileImageMounterMissingImageSignature",
-        0xe800006e: "kAMDMobileImageMounterResponseCreationFailed",
-        0xe800006f: "kAMDMobileImageMounterMissingImageType",
-        0xe8000070: "kAMDMobileImageMounterMissingImagePath",
-        0xe8000071: "kAMDMobileImageMounterImageMapLoadFailed",
-        0xe8000072: "kAMDMobileImageMounterAlreadyMounted",
-        0xe8000073: "kAMDMobileImageMounterImageMoveFailed",
-        0xe8000074: "kAMDMobileImageMounterMountPathMissing",
-        0xe8000075: "kAMDMobileImageMounterMountPathNotEmpty",
-        0xe8000076: "kAMDMobileImageMounterImageMountFailed",
-        0xe8000077: "kAMDMobileImageMounterTrustCacheLoadFailed",
-        0xe8000078: "kAMDMobileImageMounterDigestFailed",
-        0xe8000079: "kAMDMobileImageMounterDigestCreationFailed",
-        0xe800007a: "kAMDMobileImageMounterImageVerificationFailed",
-        0xe800007b: "kAMDMobileImageMounterImageInfoCreationFailed",
-        0xe800007c: "kAMDMobileImageMounterImageMapStoreFailed",
-        0xe800007d: "kAMDBonjourSetupError",
-        0xe800007e: "kAMDDeviceOSVersionTooLow",
-        0xe800007f: "kAMDNoWifiSyncSupportError",
-        0xe8000080: "kAMDDeviceFamilyNotSupported",
-        0xe8000081: "kAMDEscrowLockedError",
-        0xe8000082: "kAMDPairingProhibitedError",
-        0xe8000083: "kAMDProhibitedBySupervision",
-        0xe8000084: "kAMDDeviceDisconnectedError",
-        0xe8000085: "kAMDTooBigError",
-        0xe8000086: "kAMDPackagePatchFailedError",
-        0xe8000087: "kAMDIncorrectArchitectureError",
-        0xe8000088: "kAMDPluginCopyFailedError",
-        0xe8000089: "kAMDBreadcrumbFailedError",
-        0xe800008a: "kAMDBreadcrumbUnlockError",
-        0xe800008b: "kAMDGeoJSONCaptureFailedError",
-        0xe800008c: "kAMDNewsstandArtworkCaptureFailedError",
-        0xe800008d: "kAMDMissingCommandError",
-        0xe800008e: "kAMDNotEntitledError",
-        0xe800008f: "kAMDMissingPackagePathError",
-        0xe8000090: "kAMDMissingContainerPathError",
-        0xe8000091: "kAMDMissingApplicationIdentifierError",
-        0xe8000092: "kAMDMissingAttributeValueError",
-        0xe8000093: "kAMDLookupFailedError",
-        0xe8000094: "kAMDDictCreationFailedError",
-        0xe8000095: "kAMDUserDeniedPairingError",
-        0xe8000096: "kAMDPairingDialogResponsePendingError",
-        0xe8000097: "kAMDInstallProhibitedError",
-        0xe8000098: "kAMDUninstallProhibitedError",
-        0xe8000099: "kAMDFMiPProtectedError",
-        0xe800009a: "kAMDMCProtected",
-        0xe800009b: "kAMDMCChallengeRequired",
-        0xe800009c: "kAMDMissingBundleVersionError",
-        0xe800009d: "kAMDAppBlacklistedError",
-        0xe800009e: "This app contains an app extension with an illegal bundle identifier. App extension bundle identifiers must have a prefix consisting of their containing application's bundle identifier followed by a '.'.",
-        0xe800009f: "If an app extension defines the XPCService key in its Info.plist, it must have a dictionary value.",
-        0xe80000a0: "App extensions must define the NSExtension key with a dictionary value in their Info.plist.",
-        0xe80000a1: "If an app extension defines the CFBundlePackageType key in its Info.plist, it must have the value \"XPC!\".",
-        0xe80000a2: "App extensions must define either NSExtensionMainStoryboard or NSExtensionPrincipalClass keys in the NSExtension dictionary in their Info.plist.",
-        0xe80000a3: "If an app extension defines the NSExtensionContextClass key in the NSExtension dictionary in its Info.plist, it must have a string value containing one or more characters.",
-        0xe80000a4: "If an app extension defines the NSExtensionContextHostClass key in the NSExtension dictionary in its Info.plist, it must have a string value containing one or more characters.",
-        0xe80000a5: "If an app extension defines the NSExtensionViewControllerHostClass key in the NSExtension dictionary in its Info.plist, it must have a string value containing one or more characters.",
-        0xe80000a6: "This app contains an app extension that does not define the NSExtensionPointIdentifier key in its Info.plist. This key must have a reverse-DNS format string value.",
-        0xe80000a7: "This app contains an app extension that does not define the NSExtensionPointIdentifier key in its Info.plist with a valid reverse-DNS format string value.",
-        0xe80000a8: "If an app extension defines the NSExtensionAttributes key in the NSExtension dictionary in its Info.plist, it must have a dictionary value.",
-        0xe80000a9: "If an app extension defines the NSExtensionPointName key in the NSExtensionAttributes dictionary in the NSExtension dictionary in its Info.plist, it must have a string value containing one or more characters.",
-        0xe80000aa: "If an app extension defines the NSExtensionPointVersion key in the NSExtensionAttributes dictionary in the NSExtension dictionary in its Info.plist, it must have a string value containing one or more characters.",
-        0xe80000ab: "This app or a bundle it contains does not define the CFBundleName key in its Info.plist with a string value containing one or more characters.",
-        0xe80000ac: "This app or a bundle it contains does not define the CFBundleDisplayName key in its Info.plist with a string value containing one or more characters.",
-        0xe80000ad: "This app or a bundle it contains defines the CFBundleShortVersionStringKey key in its Info.plist with a non-string value or a zero-length string value.",
-        0xe80000ae: "This app or a bundle it contains defines the RunLoopType key in the XPCService dictionary in its Info.plist with a non-string value or a zero-length string value.",
-        0xe80000af: "This app or a bundle it contains defines the ServiceType key in the XPCService dictionary in its Info.plist with a non-string value or a zero-length string value.",
-        0xe80000b0: "This application or a bundle it contains has the same bundle identifier as this application or another bundle that it contains. Bundle identifiers must be unique.",
-        0xe80000b1: "This app contains an app extension that specifies an extension point identifier that is not supported on this version of iOS for the value of the NSExtensionPointIdentifier key in its Info.plist.",
-        0xe80000b2: "This app contains multiple app extensions that are file providers. Apps are only allowed to contain at most a single file provider app extension.",
-        0xe80000b3: "kMobileHouseArrestMissingCommand",
-        0xe80000b4: "kMobileHouseArrestUnknownCommand",
-        0xe80000b5: "kMobileHouseArrestMissingIdentifier",
-        0xe80000b6: "kMobileHouseArrestDictionaryFailed",
-        0xe80000b7: "kMobileHouseArrestInstallationLookupFailed",
-        0xe80000b8: "kMobileHouseArrestApplicationLookupFailed",
-        0xe80000b9: "kMobileHouseArrestMissingContainer",
-        # 0xe80000ba does not exist
-        0xe80000bb: "kMobileHouseArrestPathConversionFailed",
-        0xe80000bc: "kMobileHouseArrestPathMissing",
-        0xe80000bd: "kMobileHouseArrestInvalidPath",
-        0xe80000be: "kAMDMismatchedApplicationIdentifierEntitlementError",
-        0xe80000bf: "kAMDInvalidSymlinkError",
-        0xe80000c0: "kAMDNoSpaceError",
-        0xe80000c1: "The WatchKit app extension must have, in its Info.plist's NSExtension dictionary's NSExtensionAttributes dictionary, the key WKAppBundleIdentifier with a value equal to the associated WatchKit app's bundle identifier.",
-        0xe80000c2: "This app is not a valid AppleTV Stub App",
-        0xe80000c3: "kAMDBundleiTunesMetadataVersionMismatchError",
-        0xe80000c4: "kAMDInvalidiTunesMetadataPlistError",
-        0xe80000c5: "kAMDMismatchedBundleIDSigningIdentifierError",
-        0xe80000c6: "This app contains multiple WatchKit app extensions. Only a single WatchKit extension is allowed.",
-        0xe80000c7: "A WatchKit app within this app is not a valid bundle.",
-        0xe80000c8: "kAMDDeviceNotSupportedByThinningError",
-        0xe80000c9: "The UISupportedDevices key in this app's Info.plist does not specify a valid set of supported devices.",
-        0xe80000ca: "This app contains an app extension with an illegal bundle identifier. App extension bundle identifiers must have a prefix consisting of their containing application's bundle identifier followed by a '.', with no further '.' characters after the prefix.",
-        0xe80000cb: "kAMDAppexBundleIDConflictWithOtherIdentifierError",
-        0xe80000cc: "kAMDBundleIDConflictWithOtherIdentifierError",
-        0xe80000cd: "This app contains multiple WatchKit 1.0 apps. Only a single WatchKit 1.0 app is allowed.",
-        0xe80000ce: "This app contains multiple WatchKit 2.0 apps. Only a single WatchKit 2.0 app is allowed.",
-        0xe80000cf: "The WatchKit app has an invalid stub executable.",
-        0xe80000d0: "The WatchKit app has multiple app extensions. Only a single WatchKit extension is allowed in a WatchKit app, and only if this is a WatchKit 2.0 app.",
-        0xe80000d1: "The WatchKit 2.0 app contains non-WatchKit app extensions. Only WatchKit app extensions are allowed in WatchKit apps.",
-        0xe80000d2: "The WatchKit app has one or more embedded frameworks. Frameworks are only allowed in WatchKit app extensions in WatchKit 2.0 apps.",
-        0xe80000d3: "This app contains a WatchKit 1.0 app with app extensions. This is not allowed.",
-        0xe80000d4: "This app contains a WatchKit 2.0 app without an app extension. WatchKit 2.0 apps must contain a WatchKit app extension.",
-        0xe80000d5: "The WatchKit app's Info.plist must have a WKCompanionAppBundleIdentifier key set to the bundle identifier of the companion app.",
-        0xe80000d6: "The WatchKit app's Info.plist contains a non-string key.",
-        0xe80000d7: "The WatchKit app's Info.plist contains a key that is not in the whitelist of allowed keys for a WatchKit app.",
-        0xe80000d8: "The WatchKit 1.0 and a WatchKit 2.0 apps within this app must have have the same bundle identifier.",
-        0xe80000d9: "This app contains a WatchKit app with an invalid bundle identifier. The bundle identifier of a WatchKit app must have a prefix consisting of the companion app's bundle identifier, followed by a '.'.",
-        0xe80000da: "This app contains a WatchKit app where the UIDeviceFamily key in its Info.plist does not specify the value 4 to indicate that it's compatible with the Apple Watch device type.",
-        0xe80000db: "The device is out of storage for apps. Please remove some apps from the device and try again.",
-        0xe80000dc: "This app or an app that it contains has a Siri Intents app extension that is missing the IntentsSupported array in the NSExtensionAttributes dictionary in the NSExtension dictionary in its Info.plist.",
-        0xe80000dd: "This app or an app that it contains has a Siri Intents app extension that does not correctly define the IntentsRestrictedWhileLocked key in the NSExtensionAttributes dictionary in the NSExtension dictionary in its Info.plist. The key's value must be an array of strings.",
-        0xe80000de: "This app or an app that it contains has a Siri Intents app extension that declares values in its IntentsRestrictedWhileLocked key's array value that are not in its IntentsSupported key's array value (in the NSExtensionAttributes dictionary in the NSExtension dictionary in its Info.plist).",
-        0xe80000df: "This app or an app that it contains declares multiple Siri Intents app extensions that declare one or more of the same values in the IntentsSupported array in the NSExtensionAttributes dictionary in the NSExtension dictionary in their Info.plist. IntentsSupported must be distinct among a given Siri Intents extension type within an app.",
-        0xe80000e0: "The WatchKit 2.0 app, which expects to be compatible with watchOS versions earlier than 3.0, contains a non-WatchKit extension in a location that's not compatible with watchOS versions earlier than 3.0.",
-        0xe80000e1: "The WatchKit 2.0 app, which expects to be compatible with watchOS versions earlier than 3.0, contains a framework in a location that's not compatible with watchOS versions earlier than 3.0.",
-        0xe80000e2: "kAMDMobileImageMounterDeviceLocked",
-        0xe80000e3: "kAMDInvalidSINFError",
-        0xe80000e4: "Multiple iMessage app extensions were found in this app. Only one is allowed.",
-        0xe80000e5: "This iMessage application is missing its required iMessage app extension.",
-        0xe80000e6: "This iMessage application contains an app extension type other than an iMessage app extension. iMessage applications may only contain one iMessage app extension and may not contain other types of app extensions.",
-        0xe80000e7: "This app contains a WatchKit app with one or more Siri Intents app extensions that declare IntentsSupported that are not declared in any of the companion app's Siri Intents app extensions. WatchKit Siri Intents extensions' IntentsSupported values must be a subset of the companion app's Siri Intents extensions' IntentsSupported values.",
-        0xe80000e8: "kAMDRequireCUPairingCodeError",
-        0xe80000e9: "kAMDRequireCUPairingBackoffError",
-        0xe80000ea: "kAMDCUPairingError",
-        0xe80000eb: "kAMDCUPairingContinueError",
-        0xe80000ec: "kAMDCUPairingResetError",
-        0xe80000ed: "kAMDRequireCUPairingError",
-        0xe80000ee: "kAMDPasswordRequiredError",
-        # Errors without id->string mapping.
-        0xe8008001: "An unknown error has occurred.",
-        0xe8008002: "Attempted to modify an immutable provisioning profile.",
-        0xe8008003: "This provisioning profile is malformed.",
-        0xe8008004: "This provisioning profile does not have a valid signature (or it has a valid, but untrusted signature).",
-        0xe8008005: "This provisioning profile is malformed.",
-        0xe8008006: "This provisioning profile is malformed.",
-        0xe8008007: "This provisioning profile is malformed.",
-        0xe8008008: "This provisioning profile is malformed.",
-        0xe8008009: "The signature was not valid.",
-        0xe800800a: "Unable to allocate memory.",
-        0xe800800b: "A file operation failed.",
-        0xe800800c: "There was an error communicating with your device.",
-        0xe800800d: "There was an error communicating with your device.",
-        0xe800800e: "This provisioning profile does not have a valid signature (or it has a valid, but untrusted signature).",
-        0xe800800f: "The application's signature is valid but it does not match the expected hash.",
-        0xe8008010: "This provisioning profile is unsupported.",
-        0xe8008011: "This provisioning profile has expired.",
-        0xe8008012: "This provisioning profile cannot be installed on this device.",
-        0xe8008013: "This provisioning profile does not have a valid signature (or it has a valid, but untrusted signature).",
-        0xe8008014: "The executable contains an invalid signature.",
-        0xe8008015: "A valid provisioning profile for this executable was not found.",
-        0xe8008016: "The executable was signed with invalid entitlements.",
-        0xe8008017: "A signed resource has been added, modified, or deleted.",
-        0xe8008018: "The identity used to sign the executable is no longer valid.",
-        0xe8008019: "The application does not have a valid signature.",
-        0xe800801a: "This provisioning profile does not have a valid signature (or it has a valid, but untrusted signature).",
-        0xe800801b: "There was an error communicating with your device.",
-        0xe800801c: "No code signature found.",
-        0xe800801d: "Rejected by policy.",
-        0xe800801e: "The requested profile does not exist (it may have been removed).",
-        0xe800801f: "Attempted to install a Beta profile without the proper entitlement.",
-        0xe8008020: "Attempted to install a Beta profile over lockdown connection.",
-        0xe8008021: "The maximum number of apps for free development profiles has been reached.",
-        0xe8008022: "An error occured while accessing the profile database.",
-        0xe8008023: "An error occured while communicating with the agent.",
-        0xe8008024: "The provisioning profile is banned.",
-        0xe8008025: "The user did not explicitly trust the provisioning profile.",
-        0xe8008026: "The provisioning profile requires online authorization.",
-        0xe8008027: "The cdhash is not in the trust cache.",
-        0xe8008028: "Invalid arguments or option combination.",
-    }
-    return _error_code_to_message.get(error_code, 'Unknown Error')
+# Sourced this list from https://github.com/ios-control/ios-deploy
+_ERROR_CODE_TO_MESSAGE = types.MappingProxyType({
+    0x00000000: "kAMDSuccess",
+    0xe8000001: "kAMDUndefinedError",
+    0xe8000002: "kAMDBadHeaderError",
+    0xe8000003: "kAMDNoResourcesError",
+    0xe8000004: "kAMDReadError",
+    0xe8000005: "kAMDWriteError",
+    0xe8000006: "kAMDUnknownPacketError",
+    0xe8000007: "kAMDInvalidArgumentError",
+    0xe8000008: "kAMDNotFoundError",
+    0xe8000009: "kAMDIsDirectoryError",
+    0xe800000a: "kAMDPermissionError",
+    0xe800000b: "kAMDNotConnectedError",
+    0xe800000c: "kAMDTimeOutError",
+    0xe800000d: "kAMDOverrunError",
+    0xe800000e: "kAMDEOFError",
+    0xe800000f: "kAMDUnsupportedError",
+    0xe8000010: "kAMDFileExistsError",
+    0xe8000011: "kAMDBusyError",
+    0xe8000012: "kAMDCryptoError",
+    0xe8000013: "kAMDInvalidResponseError",
+    0xe8000014: "kAMDMissingKeyError",
+    0xe8000015: "kAMDMissingValueError",
+    0xe8000016: "kAMDGetProhibitedError",
+    0xe8000017: "kAMDSetProhibitedError",
+    0xe8000018: "kAMDRemoveProhibitedError",
+    0xe8000019: "kAMDImmutableValueError",
+    0xe800001a: "kAMDPasswordProtectedError",
+    0xe800001b: "kAMDMissingHostIDError",
+    0xe800001c: "kAMDInvalidHostIDError",
+    0xe800001d: "kAMDSessionActiveError",
+    0xe800001e: "kAMDSessionInactiveError",
+    0xe800001f: "kAMDMissingSessionIDError",
+    0xe8000020: "kAMDInvalidSessionIDError",
+    0xe8000021: "kAMDMissingServiceError",
+    0xe8000022: "kAMDInvalidServiceError",
+    0xe8000023: "kAMDInvalidCheckinError",
+    0xe8000024: "kAMDCheckinTimeoutError",
+    0xe8000025: "kAMDMissingPairRecordError",
+    0xe8000026: "kAMDInvalidActivationRecordError",
+    0xe8000027: "kAMDMissingActivationRecordError",
+    0xe8000028: "kAMDWrongDroidError",
+    0xe8000029: "kAMDSUVerificationError",
+    0xe800002a: "kAMDSUPatchError",
+    0xe800002b: "kAMDSUFirmwareError",
+    0xe800002c: "kAMDProvisioningProfileNotValid",
+    0xe800002d: "kAMDSendMessageError",
+    0xe800002e: "kAMDReceiveMessageError",
+    0xe800002f: "kAMDMissingOptionsError",
+    0xe8000030: "kAMDMissingImageTypeError",
+    0xe8000031: "kAMDDigestFailedError",
+    0xe8000032: "kAMDStartServiceError",
+    0xe8000033: "kAMDInvalidDiskImageError",
+    0xe8000034: "kAMDMissingDigestError",
+    0xe8000035: "kAMDMuxError",
+    0xe8000036: "kAMDApplicationAlreadyInstalledError",
+    0xe8000037: "kAMDApplicationMoveFailedError",
+    0xe8000038: "kAMDApplicationSINFCaptureFailedError",
+    0xe8000039: "kAMDApplicationSandboxFailedError",
+    0xe800003a: "kAMDApplicationVerificationFailedError",
+    0xe800003b: "kAMDArchiveDestructionFailedError",
+    0xe800003c: "kAMDBundleVerificationFailedError",
+    0xe800003d: "kAMDCarrierBundleCopyFailedError",
+    0xe800003e: "kAMDCarrierBundleDirectoryCreationFailedError",
+    0xe800003f: "kAMDCarrierBundleMissingSupportedSIMsError",
+    0xe8000040: "kAMDCommCenterNotificationFailedError",
+    0xe8000041: "kAMDContainerCreationFailedError",
+    0xe8000042: "kAMDContainerP0wnFailedError",
+    0xe8000043: "kAMDContainerRemovalFailedError",
+    0xe8000044: "kAMDEmbeddedProfileInstallFailedError",
+    0xe8000045: "kAMDErrorError",
+    0xe8000046: "kAMDExecutableTwiddleFailedError",
+    0xe8000047: "kAMDExistenceCheckFailedError",
+    0xe8000048: "kAMDInstallMapUpdateFailedError",
+    0xe8000049: "kAMDManifestCaptureFailedError",
+    0xe800004a: "kAMDMapGenerationFailedError",
+    0xe800004b: "kAMDMissingBundleExecutableError",
+    0xe800004c: "kAMDMissingBundleIdentifierError",
+    0xe800004d: "kAMDMissingBundlePathError",
+    0xe800004e: "kAMDMissingContainerError",
+    0xe800004f: "kAMDNotificationFailedError",
+    0xe8000050: "kAMDPackageExtractionFailedError",
+    0xe8000051: "kAMDPackageInspectionFailedError",
+    0xe8000052: "kAMDPackageMoveFailedError",
+    0xe8000053: "kAMDPathConversionFailedError",
+    0xe8000054: "kAMDRestoreContainerFailedError",
+    0xe8000055: "kAMDSeatbeltProfileRemovalFailedError",
+    0xe8000056: "kAMDStageCreationFailedError",
+    0xe8000057: "kAMDSymlinkFailedError",
+    0xe8000058: "kAMDiTunesArtworkCaptureFailedError",
+    0xe8000059: "kAMDiTunesMetadataCaptureFailedError",
+    0xe800005a: "kAMDAlreadyArchivedError",
+    0xe800005b: "kAMDServiceLimitError",
+    0xe800005c: "kAMDInvalidPairRecordError",
+    0xe800005d: "kAMDServiceProhibitedError",
+    0xe800005e: "kAMDCheckinSetupFailedError",
+    0xe800005f: "kAMDCheckinConnectionFailedError",
+    0xe8000060: "kAMDCheckinReceiveFailedError",
+    0xe8000061: "kAMDCheckinResponseFailedError",
+    0xe8000062: "kAMDCheckinSendFailedError",
+    0xe8000063: "kAMDMuxCreateListenerError",
+    0xe8000064: "kAMDMuxGetListenerError",
+    0xe8000065: "kAMDMuxConnectError",
+    0xe8000066: "kAMDUnknownCommandError",
+    0xe8000067: "kAMDAPIInternalError",
+    0xe8000068: "kAMDSavePairRecordFailedError",
+    0xe8000069: "kAMDCheckinOutOfMemoryError",
+    0xe800006a: "kAMDDeviceTooNewError",
+    0xe800006b: "kAMDDeviceRefNoGood",
+    0xe800006c: "kAMDCannotTranslateError",
+    0xe800006d: "kAMDMobileImageMounterMissingImageSignature",
+    0xe800006e: "kAMDMobileImageMounterResponseCreationFailed",
+    0xe800006f: "kAMDMobileImageMounterMissingImageType",
+    0xe8000070: "kAMDMobileImageMounterMissingImagePath",
+    0xe8000071: "kAMDMobileImageMounterImageMapLoadFailed",
+    0xe8000072: "kAMDMobileImageMounterAlreadyMounted",
+    0xe8000073: "kAMDMobileImageMounterImageMoveFailed",
+    0xe8000074: "kAMDMobileImageMounterMountPathMissing",
+    0xe8000075: "kAMDMobileImageMounterMountPathNotEmpty",
+    0xe8000076: "kAMDMobileImageMounterImageMountFailed",
+    0xe8000077: "kAMDMobileImageMounterTrustCacheLoadFailed",
+    0xe8000078: "kAMDMobileImageMounterDigestFailed",
+    0xe8000079: "kAMDMobileImageMounterDigestCreationFailed",
+    0xe800007a: "kAMDMobileImageMounterImageVerificationFailed",
+    0xe800007b: "kAMDMobileImageMounterImageInfoCreationFailed",
+    0xe800007c: "kAMDMobileImageMounterImageMapStoreFailed",
+    0xe800007d: "kAMDBonjourSetupError",
+    0xe800007e: "kAMDDeviceOSVersionTooLow",
+    0xe800007f: "kAMDNoWifiSyncSupportError",
+    0xe8000080: "kAMDDeviceFamilyNotSupported",
+    0xe8000081: "kAMDEscrowLockedError",
+    0xe8000082: "kAMDPairingProhibitedError",
+    0xe8000083: "kAMDProhibitedBySupervision",
+    0xe8000084: "kAMDDeviceDisconnectedError",
+    0xe8000085: "kAMDTooBigError",
+    0xe8000086: "kAMDPackagePatchFailedError",
+    0xe8000087: "kAMDIncorrectArchitectureError",
+    0xe8000088: "kAMDPluginCopyFailedError",
+    0xe8000089: "kAMDBreadcrumbFailedError",
+    0xe800008a: "kAMDBreadcrumbUnlockError",
+    0xe800008b: "kAMDGeoJSONCaptureFailedError",
+    0xe800008c: "kAMDNewsstandArtworkCaptureFailedError",
+    0xe800008d: "kAMDMissingCommandError",
+    0xe800008e: "kAMDNotEntitledError",
+    0xe800008f: "kAMDMissingPackagePathError",
+    0xe8000090: "kAMDMissingContainerPathError",
+    0xe8000091: "kAMDMissingApplicationIdentifierError",
+    0xe8000092: "kAMDMissingAttributeValueError",
+    0xe8000093: "kAMDLookupFailedError",
+    0xe8000094: "kAMDDictCreationFailedError",
+    0xe8000095: "kAMDUserDeniedPairingError",
+    0xe8000096: "kAMDPairingDialogResponsePendingError",
+    0xe8000097: "kAMDInstallProhibitedError",
+    0xe8000098: "kAMDUninstallProhibitedError",
+    0xe8000099: "kAMDFMiPProtectedError",
+    0xe800009a: "kAMDMCProtected",
+    0xe800009b: "kAMDMCChallengeRequired",
+    0xe800009c: "kAMDMissingBundleVersionError",
+    0xe800009d: "kAMDAppBlacklistedError",
+    0xe800009e: "This app contains an app extension with an illegal bundle identifier. App extension bundle identifiers must have a prefix consisting of their containing application's bundle identifier followed by a '.'.",
+    0xe800009f: "If an app extension defines the XPCService key in its Info.plist, it must have a dictionary value.",
+    0xe80000a0: "App extensions must define the NSExtension key with a dictionary value in their Info.plist.",
+    0xe80000a1: "If an app extension defines the CFBundlePackageType key in its Info.plist, it must have the value \"XPC!\".",
+    0xe80000a2: "App extensions must define either NSExtensionMainStoryboard or NSExtensionPrincipalClass keys in the NSExtension dictionary in their Info.plist.",
+    0xe80000a3: "If an app extension defines the NSExtensionContextClass key in the NSExtension dictionary in its Info.plist, it must have a string value containing one or more characters.",
+    0xe80000a4: "If an app extension defines the NSExtensionContextHostClass key in the NSExtension dictionary in its Info.plist, it must have a string value containing one or more characters.",
+    0xe80000a5: "If an app extension defines the NSExtensionViewControllerHostClass key in the NSExtension dictionary in its Info.plist, it must have a string value containing one or more characters.",
+    0xe80000a6: "This app contains an app extension that does not define the NSExtensionPointIdentifier key in its Info.plist. This key must have a reverse-DNS format string value.",
+    0xe80000a7: "This app contains an app extension that does not define the NSExtensionPointIdentifier key in its Info.plist with a valid reverse-DNS format string value.",
+    0xe80000a8: "If an app extension defines the NSExtensionAttributes key in the NSExtension dictionary in its Info.plist, it must have a dictionary value.",
+    0xe80000a9: "If an app extension defines the NSExtensionPointName key in the NSExtensionAttributes dictionary in the NSExtension dictionary in its Info.plist, it must have a string value containing one or more characters.",
+    0xe80000aa: "If an app extension defines the NSExtensionPointVersion key in the NSExtensionAttributes dictionary in the NSExtension dictionary in its Info.plist, it must have a string value containing one or more characters.",
+    0xe80000ab: "This app or a bundle it contains does not define the CFBundleName key in its Info.plist with a string value containing one or more characters.",
+    0xe80000ac: "This app or a bundle it contains does not define the CFBundleDisplayName key in its Info.plist with a string value containing one or more characters.",
+    0xe80000ad: "This app or a bundle it contains defines the CFBundleShortVersionStringKey key in its Info.plist with a non-string value or a zero-length string value.",
+    0xe80000ae: "This app or a bundle it contains defines the RunLoopType key in the XPCService dictionary in its Info.plist with a non-string value or a zero-length string value.",
+    0xe80000af: "This app or a bundle it contains defines the ServiceType key in the XPCService dictionary in its Info.plist with a non-string value or a zero-length string value.",
+    0xe80000b0: "This application or a bundle it contains has the same bundle identifier as this application or another bundle that it contains. Bundle identifiers must be unique.",
+    0xe80000b1: "This app contains an app extension that specifies an extension point identifier that is not supported on this version of iOS for the value of the NSExtensionPointIdentifier key in its Info.plist.",
+    0xe80000b2: "This app contains multiple app extensions that are file providers. Apps are only allowed to contain at most a single file provider app extension.",
+    0xe80000b3: "kMobileHouseArrestMissingCommand",
+    0xe80000b4: "kMobileHouseArrestUnknownCommand",
+    0xe80000b5: "kMobileHouseArrestMissingIdentifier",
+    0xe80000b6: "kMobileHouseArrestDictionaryFailed",
+    0xe80000b7: "kMobileHouseArrestInstallationLookupFailed",
+    0xe80000b8: "kMobileHouseArrestApplicationLookupFailed",
+    0xe80000b9: "kMobileHouseArrestMissingContainer",
+    # 0xe80000ba does not exist
+    0xe80000bb: "kMobileHouseArrestPathConversionFailed",
+    0xe80000bc: "kMobileHouseArrestPathMissing",
+    0xe80000bd: "kMobileHouseArrestInvalidPath",
+    0xe80000be: "kAMDMismatchedApplicationIdentifierEntitlementError",
+    0xe80000bf: "kAMDInvalidSymlinkError",
+    0xe80000c0: "kAMDNoSpaceError",
+    0xe80000c1: "The WatchKit app extension must have, in its Info.plist's NSExtension dictionary's NSExtensionAttributes dictionary, the key WKAppBundleIdentifier with a value equal to the associated WatchKit app's bundle identifier.",
+    0xe80000c2: "This app is not a valid AppleTV Stub App",
+    0xe80000c3: "kAMDBundleiTunesMetadataVersionMismatchError",
+    0xe80000c4: "kAMDInvalidiTunesMetadataPlistError",
+    0xe80000c5: "kAMDMismatchedBundleIDSigningIdentifierError",
+    0xe80000c6: "This app contains multiple WatchKit app extensions. Only a single WatchKit extension is allowed.",
+    0xe80000c7: "A WatchKit app within this app is not a valid bundle.",
+    0xe80000c8: "kAMDDeviceNotSupportedByThinningError",
+    0xe80000c9: "The UISupportedDevices key in this app's Info.plist does not specify a valid set of supported devices.",
+    0xe80000ca: "This app contains an app extension with an illegal bundle identifier. App extension bundle identifiers must have a prefix consisting of their containing application's bundle identifier followed by a '.', with no further '.' characters after the prefix.",
+    0xe80000cb: "kAMDAppexBundleIDConflictWithOtherIdentifierError",
+    0xe80000cc: "kAMDBundleIDConflictWithOtherIdentifierError",
+    0xe80000cd: "This app contains multiple WatchKit 1.0 apps. Only a single WatchKit 1.0 app is allowed.",
+    0xe80000ce: "This app contains multiple WatchKit 2.0 apps. Only a single WatchKit 2.0 app is allowed.",
+    0xe80000cf: "The WatchKit app has an invalid stub executable.",
+    0xe80000d0: "The WatchKit app has multiple app extensions. Only a single WatchKit extension is allowed in a WatchKit app, and only if this is a WatchKit 2.0 app.",
+    0xe80000d1: "The WatchKit 2.0 app contains non-WatchKit app extensions. Only WatchKit app extensions are allowed in WatchKit apps.",
+    0xe80000d2: "The WatchKit app has one or more embedded frameworks. Frameworks are only allowed in WatchKit app extensions in WatchKit 2.0 apps.",
+    0xe80000d3: "This app contains a WatchKit 1.0 app with app extensions. This is not allowed.",
+    0xe80000d4: "This app contains a WatchKit 2.0 app without an app extension. WatchKit 2.0 apps must contain a WatchKit app extension.",
+    0xe80000d5: "The WatchKit app's Info.plist must have a WKCompanionAppBundleIdentifier key set to the bundle identifier of the companion app.",
+    0xe80000d6: "The WatchKit app's Info.plist contains a non-string key.",
+    0xe80000d7: "The WatchKit app's Info.plist contains a key that is not in the whitelist of allowed keys for a WatchKit app.",
+    0xe80000d8: "The WatchKit 1.0 and a WatchKit 2.0 apps within this app must have have the same bundle identifier.",
+    0xe80000d9: "This app contains a WatchKit app with an invalid bundle identifier. The bundle identifier of a WatchKit app must have a prefix consisting of the companion app's bundle identifier, followed by a '.'.",
+    0xe80000da: "This app contains a WatchKit app where the UIDeviceFamily key in its Info.plist does not specify the value 4 to indicate that it's compatible with the Apple Watch device type.",
+    0xe80000db: "The device is out of storage for apps. Please remove some apps from the device and try again.",
+    0xe80000dc: "This app or an app that it contains has a Siri Intents app extension that is missing the IntentsSupported array in the NSExtensionAttributes dictionary in the NSExtension dictionary in its Info.plist.",
+    0xe80000dd: "This app or an app that it contains has a Siri Intents app extension that does not correctly define the IntentsRestrictedWhileLocked key in the NSExtensionAttributes dictionary in the NSExtension dictionary in its Info.plist. The key's value must be an array of strings.",
+    0xe80000de: "This app or an app that it contains has a Siri Intents app extension that declares values in its IntentsRestrictedWhileLocked key's array value that are not in its IntentsSupported key's array value (in the NSExtensionAttributes dictionary in the NSExtension dictionary in its Info.plist).",
+    0xe80000df: "This app or an app that it contains declares multiple Siri Intents app extensions that declare one or more of the same values in the IntentsSupported array in the NSExtensionAttributes dictionary in the NSExtension dictionary in their Info.plist. IntentsSupported must be distinct among a given Siri Intents extension type within an app.",
+    0xe80000e0: "The WatchKit 2.0 app, which expects to be compatible with watchOS versions earlier than 3.0, contains a non-WatchKit extension in a location that's not compatible with watchOS versions earlier than 3.0.",
+    0xe80000e1: "The WatchKit 2.0 app, which expects to be compatible with watchOS versions earlier than 3.0, contains a framework in a location that's not compatible with watchOS versions earlier than 3.0.",
+    0xe80000e2: "kAMDMobileImageMounterDeviceLocked",
+    0xe80000e3: "kAMDInvalidSINFError",
+    0xe80000e4: "Multiple iMessage app extensions were found in this app. Only one is allowed.",
+    0xe80000e5: "This iMessage application is missing its required iMessage app extension.",
+    0xe80000e6: "This iMessage application contains an app extension type other than an iMessage app extension. iMessage applications may only contain one iMessage app extension and may not contain other types of app extensions.",
+    0xe80000e7: "This app contains a WatchKit app with one or more Siri Intents app extensions that declare IntentsSupported that are not declared in any of the companion app's Siri Intents app extensions. WatchKit Siri Intents extensions' IntentsSupported values must be a subset of the companion app's Siri Intents extensions' IntentsSupported values.",
+    0xe80000e8: "kAMDRequireCUPairingCodeError",
+    0xe80000e9: "kAMDRequireCUPairingBackoffError",
+    0xe80000ea: "kAMDCUPairingError",
+    0xe80000eb: "kAMDCUPairingContinueError",
+    0xe80000ec: "kAMDCUPairingResetError",
+    0xe80000ed: "kAMDRequireCUPairingError",
+    0xe80000ee: "kAMDPasswordRequiredError",
+    # Errors without id->string mapping.
+    0xe8008001: "An unknown error has occurred.",
+    0xe8008002: "Attempted to modify an immutable provisioning profile.",
+    0xe8008003: "This provisioning profile is malformed.",
+    0xe8008004: "This provisioning profile does not have a valid signature (or it has a valid, but untrusted signature).",
+    0xe8008005: "This provisioning profile is malformed.",
+    0xe8008006: "This provisioning profile is malformed.",
+    0xe8008007: "This provisioning profile is malformed.",
+    0xe8008008: "This provisioning profile is malformed.",
+    0xe8008009: "The signature was not valid.",
+    0xe800800a: "Unable to allocate memory.",
+    0xe800800b: "A file operation failed.",
+    0xe800800c: "There was an error communicating with your device.",
+    0xe800800d: "There was an error communicating with your device.",
+    0xe800800e: "This provisioning profile does not have a valid signature (or it has a valid, but untrusted signature).",
+    0xe800800f: "The application's signature is valid but it does not match the expected hash.",
+    0xe8008010: "This provisioning profile is unsupported.",
+    0xe8008011: "This provisioning profile has expired.",
+    0xe8008012: "This provisioning profile cannot be installed on this device.",
+    0xe8008013: "This provisioning profile does not have a valid signature (or it has a valid, but untrusted signature).",
+    0xe8008014: "The executable contains an invalid signature.",
+    0xe8008015: "A valid provisioning profile for this executable was not found.",
+    0xe8008016: "The executable was signed with invalid entitlements.",
+    0xe8008017: "A signed resource has been added, modified, or deleted.",
+    0xe8008018: "The identity used to sign the executable is no longer valid.",
+    0xe8008019: "The application does not have a valid signature.",
+    0xe800801a: "This provisioning profile does not have a valid signature (or it has a valid, but untrusted signature).",
+    0xe800801b: "There was an error communicating with your device.",
+    0xe800801c: "No code signature found.",
+    0xe800801d: "Rejected by policy.",
+    0xe800801e: "The requested profile does not exist (it may have been removed).",
+    0xe800801f: "Attempted to install a Beta profile without the proper entitlement.",
+    0xe8008020: "Attempted to install a Beta profile over lockdown connection.",
+    0xe8008021: "The maximum number of apps for free development profiles has been reached.",
+    0xe8008022: "An error occured while accessing the profile database.",
+    0xe8008023: "An error occured while communicating with the agent.",
+    0xe8008024: "The provisioning profile is banned.",
+    0xe8008025: "The user did not explicitly trust the provisioning profile.",
+    0xe8008026: "The provisioning profile requires online authorization.",
+    0xe8008027: "The cdhash is not in the trust cache.",
+    0xe8008028: "Invalid arguments or option combination.",
+})
+
+# The kAMD errors and the provisioning profile errors are each numbered
+# densely from a base code, so index them directly by offset.
+def _error_message_table(base):
+    offsets = [code & 0xff for code in _ERROR_CODE_TO_MESSAGE if code & 0xffffff00 == base]
+    return tuple(_ERROR_CODE_TO_MESSAGE.get(base | offset) for offset in range(max(offsets) + 1))
+
+_AMD_ERROR_MESSAGES = _error_message_table(0xe8000000)
+_PROFILE_ERROR_MESSAGES = _error_message_table(0xe8008000)
+
+def _get_mobile_device_error(error_code, _amdMessages=_AMD_ERROR_MESSAGES, _profileMessages=_PROFILE_ERROR_MESSAGES, _messages=_ERROR_CODE_TO_MESSAGE):
+    # The tables are bound as defaults so lookups are local rather than global.
+    base = error_code & 0xffffff00
+    if base == 0xe8000000:
+        table = _amdMessages
+    elif base == 0xe8008000:
+        table = _profileMessages
+    else:
+        return _messages.get(error_code, 'Unknown Error')
+    offset = error_code & 0xff
+    return (table[offset] if offset < len(table) else None) or 'Unknown Error'
 
 class MobileDeviceError(Exception):
     def __init__(self, error_code):
         self.error_code = error_code
         self.error_message = _get_mobile_device_error(error_code)
+        self._description = '{}: {}'.format(self.error_code, self.error_message)
     def __repr__(self):
-        return '{}: {}'.format(self.error_code, self.error_message)
+        return self._description
     def __str__(self):
-        return '{}: {}'.format(self.error_code, self.error_message)
+        return self._description
 
 # ws2_32.dll
 
@@ -746,79 +929,172 @@ if sys.platform == 'win32':
 
         def __init__(self, socketDescriptor):
             self._socket = socketDescriptor
+            self._timeout = ctypes.c_int()
 
-        def send(self, data):
-            return socket_send(self._socket, data, len(data), 0)
+        def send(self, data, _send=socket_send):
+            return _send(self._socket, data, len(data), 0)
 
         def sendall(self, data):
-            while data:
-                result = self.send(data)
+            # Walk a view of the data rather than re-slicing what is left after
+            # every partial send, copying at most 64 KiB per call.
+            view = memoryview(data)
+            sent = 0
+            while sent < len(view):
+                result = self.send(bytes(view[sent:sent + 65536]))
                 if result < 0:
                     raise RuntimeError('Error sending data: %d' % result)
-                data = data[result:]
+                sent += result
 
-        def recv(self, bytes):
-            data = ctypes.create_string_buffer(bytes)
-            result = socket_recv(self._socket, data, bytes, 0)
+        def recv(self, length, _recv=socket_recv):
+            data = ctypes.create_string_buffer(length)
+            result = _recv(self._socket, data, length, 0)
             if result < 0:
                 raise RuntimeError('Error receiving data: %d' % result)
-            return data.raw[:result]
+            return bytes(memoryview(data)[:result])
 
         def close(self):
             socket_close(self._socket)
             self._socket = None
 
-        def settimeout(self, timeout):
-            ms = int(timeout * 1000)
-            value = ctypes.c_int(ms)
-            e = socket_setsockopt(self._socket, SOL_SOCKET, SO_SNDTIMEO, ctypes.byref(value), 4)
+        def settimeout(self, timeout, _setsockopt=socket_setsockopt):
+            self._timeout.value = int(timeout * 1000)
+            value = ctypes.byref(self._timeout)
+            e = _setsockopt(self._socket, SOL_SOCKET, SO_SNDTIMEO, value, 4)
             if e != 0:
                 raise RuntimeError('setsockopt returned %d' % e)
-            e = socket_setsockopt(self._socket, SOL_SOCKET, SO_RCVTIMEO, ctypes.byref(value), 4)
+            e = _setsockopt(self._socket, SOL_SOCKET, SO_RCVTIMEO, value, 4)
             if e != 0:
                 raise RuntimeError('setsockopt returned %d' % e)
 
+def _load_plist(data):
+    """
+    Parses plist bytes, going straight to the binary parser for bplist data
+    instead of letting plistlib sniff the format.
+    """
+    if data[:8] == b'bplist00':
+        return plistlib.loads(data, fmt=plistlib.FMT_BINARY)
+    return plistlib.loads(data, fmt=plistlib.FMT_XML)
+
+def _set_tcp_nodelay(fd):
+    """
+    Disables Nagle's algorithm on a service socket so small request/response
+    packets are sent immediately.  This only matters where usbmuxd is reached
+    over TCP (win32); on Unix domain sockets the option is rejected and ignored.
+    """
+    try:
+        sock = socket.socket(fileno=fd)
+    except OSError:
+        return
+    try:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    except OSError:
+        pass
+    finally:
+        sock.detach()
+
+@functools.lru_cache(maxsize=32)
+def _read_plist_file(path, mtime):
+    """
+    Loads a plist file.  The modification time is part of the cache key, so an
+    edited file is read again.
+    """
+    with open(path, 'rb') as f:
+        return _load_plist(f.read())
+
 class SecureService(object):
     def __init__(self, service_connection):
         self._service_connection = service_connection
+        self._recvBuffer = ctypes.create_string_buffer(65536)
+
+        # Connections that never negotiated SSL are plain sockets, so bytes can
+        # be moved with os.read/os.write instead of going through the framework.
+        self._fd = None
+        if sys.platform != 'win32' and AMDServiceConnectionGetSecureIOContext:
+            if not AMDServiceConnectionGetSecureIOContext(service_connection):
+                self._fd = AMDServiceConnectionGetSocket(service_connection)
 
     def sendall(self, data):
+        if self._fd is not None:
+            view = memoryview(data)
+            while view:
+                view = view[os.write(self._fd, view):]
+            return
+        if not isinstance(data, bytes):
+            # Pass writable buffers such as bytearray slices without copying them.
+            data = (ctypes.c_char * len(data)).from_buffer(data)
         bytes_sent = AMDServiceConnectionSend(self._service_connection, data, len(data))
         if bytes_sent != len(data):
             raise RuntimeError('Sent {} bytes but was expecting to send {}'.format(bytes_sent, len(data)))
 
     def recv(self, length):
-        data = ctypes.create_string_buffer(length)
+        if self._fd is not None:
+            return os.read(self._fd, length)
+        length = min(length, len(self._recvBuffer))
         try:
-            received = AMDServiceConnectionReceive(self._service_connection, data, ctypes.c_uint32(length))
-            return data.raw[:received]
+            received = AMDServiceConnectionReceive(self._service_connection, self._recvBuffer, length)
+            return bytes(memoryview(self._recvBuffer)[:max(received, 0)])
         except Exception as e:
             print(e)
 
+    def recv_exact(self, length):
+        """
+        Receives exactly length bytes, or returns None if the connection ends
+        first.
+        """
+        data = bytearray()
+        while len(data) < length:
+            chunk = self.recv(length - len(data))
+            if not chunk:
+                return None
+            data += chunk
+        return bytes(data)
+
 class SecurePlistService(SecureService):
 
-    def build_plist(self, d, endianity='>', fmt=plistlib.FMT_XML):
-        payload = plistlib.dumps(d, fmt=fmt)
-        message = struct.pack(endianity + 'L', len(payload))
-        return message + payload
+    # Precompiled length prefixes, keyed by endianity.
+    _LENGTH_PREFIX = {
+        '>': struct.Struct('>L'),
+        '<': struct.Struct('<L'),
+    }
+
+    @classmethod
+    def build_plist(cls, d, endianity='>', fmt=plistlib.FMT_BINARY):
+        # Services don't care about key order, so skip sorting while serializing.
+        payload = plistlib.dumps(d, fmt=fmt, sort_keys=False)
+        return cls._LENGTH_PREFIX[endianity].pack(len(payload)) + payload
 
-    def send_plist(self, data, endianity='>', fmt=plistlib.FMT_XML):
+    def send_plist(self, data, endianity='>', fmt=plistlib.FMT_BINARY):
         plist = self.build_plist(data, endianity, fmt)
         return self.sendall(plist)
 
     def recv_prefixed(self, endianity='>'):
-        size = self.recv(4)
-        if not size or len(size) != 4:
+        size = self.recv_exact(4)
+        if not size:
             return
-        size = struct.unpack(endianity + 'L', size)[0]
-        return self.recv(size)
+        size = self._LENGTH_PREFIX[endianity].unpack(size)[0]
+        return self.recv_exact(size)
 
     def recv_plist(self, endianity='>'):
         data = self.recv_prefixed(endianity=endianity)
-        return plistlib.loads(data)
+        return _load_plist(data)
+
+# Commands without parameters are serialized once up front.
+_HANGUP_PLIST = SecurePlistService.build_plist({'Command': 'Hangup'})
+_COPY_DEVICES_PLIST = SecurePlistService.build_plist({'Command': 'CopyDevices'})
 
 # Finally, the good stuff.
 
+AppBundle = collections.namedtuple('AppBundle', ['path', 'infoPlist'])
+
+@functools.lru_cache(maxsize=16)
+def _app_bundle(path):
+    """
+    Resolves the paths for a local app bundle once, since the install pipeline
+    asks for them repeatedly.
+    """
+    path = os.path.abspath(path)
+    return AppBundle(path, os.path.join(path, 'Info.plist'))
+
 class MobileDeviceManager(object):
     """
     Presents interesting parts of Apple's MobileDevice framework as a much more
@@ -827,12 +1103,11 @@ class MobileDeviceManager(object):
     Usage is generally like this:
         mdm = MobileDeviceManager()
         mdm.waitForDevice()
-        mdm.connect()
 
-        # do things with the connected device...
-        mdm.installApplication('build/MyApp.app')
+        with mdm.session():
+            # do things with the connected device...
+            mdm.installApplication('build/MyApp.app')
 
-        mdm.disconnect()
         mdm.close()
     """
 
@@ -842,6 +1117,13 @@ class MobileDeviceManager(object):
         self._notification = None
         self._last_status = None
 
+        # Out-parameters reused by every service start and application lookup.
+        self._fd = ctypes.c_int()
+        self._fdRef = ctypes.byref(self._fd)
+        self._dictionary = CFDictionaryRef()
+        self._dictionaryRef = ctypes.byref(self._dictionary)
+        self._sessionDepth = 0
+
         self._transferCallback = am_device_install_application_callback(self._transfer)
         self._installCallback = am_device_install_application_callback(self._install)
         self._uninstallCallback = am_device_install_application_callback(self._uninstall)
@@ -891,6 +1173,31 @@ class MobileDeviceManager(object):
         if e != 0:
             raise MobileDeviceError(e)
 
+    @contextlib.contextmanager
+    def session(self):
+        """
+        Connects to the device and starts a session for the duration of the
+        block.  Nested blocks share the outermost connection rather than
+        pairing and starting a new session each time.
+        """
+        if self._sessionDepth == 0:
+            self.connect()
+            try:
+                self.startSession()
+            except:
+                self.disconnect()
+                raise
+        self._sessionDepth += 1
+        try:
+            yield
+        finally:
+            self._sessionDepth -= 1
+            if self._sessionDepth == 0:
+                try:
+                    self.stopSession()
+                finally:
+                    self.disconnect()
+
     def waitForDevice(self, timeout=0, device=None):
         self._waitForDeviceId = device
         self._notification = ctypes.c_void_p()
@@ -901,6 +1208,9 @@ class MobileDeviceManager(object):
 
         if timeout > 0:
             timer = CFRunLoopTimerCreate(None, CFAbsoluteTimeGetCurrent() + timeout, 0, 0, 0, self._timerCallback, None)
+            if CFRunLoopTimerSetTolerance:
+                # Let the system coalesce the timeout with other wakeups.
+                CFRunLoopTimerSetTolerance(timer, min(timeout * 0.1, 1.0))
             CFRunLoopAddTimer(CFRunLoopGetCurrent(), timer, kCFRunLoopCommonModes)
 
         CFRunLoopRun()
@@ -909,18 +1219,12 @@ class MobileDeviceManager(object):
         return self._device
 
     def productVersion(self):
-        self.connect()
-        try:
-            return CFStringGetStr(AMDeviceCopyValue(self._device, None, CFStr("ProductVersion")))
-        finally:
-            self.disconnect()
+        with self.session():
+            return CFStringGetStr(AMDeviceCopyValue(self._device, None, _CFSTR_PRODUCT_VERSION))
 
     def buildVersion(self):
-        self.connect()
-        try:
-            return CFStringGetStr(AMDeviceCopyValue(self._device, None, CFStr("BuildVersion")))
-        finally:
-            self.disconnect()
+        with self.session():
+            return CFStringGetStr(AMDeviceCopyValue(self._device, None, _CFSTR_BUILD_VERSION))
 
     def connectionId(self):
         return AMDeviceGetConnectionID(self._device)
@@ -928,78 +1232,75 @@ class MobileDeviceManager(object):
     def deviceId(self):
         return CFStringGetStr(AMDeviceCopyDeviceIdentifier(self._device))
 
-    def listImages(self):
-        images = []
+    @contextlib.contextmanager
+    def _imageMounter(self):
+        """
+        Opens the image mounter service once for a series of commands, then
+        hangs up and closes it.
+        """
         imageMounterService = self.startSecureService('com.apple.mobile.mobile_image_mounter')
         try:
             plistService = SecurePlistService(imageMounterService)
-            plistService.send_plist({'Command': 'CopyDevices'})
-            result = plistService.recv_plist()
-            if result.get('Status') == 'Complete':
-                images = result.get('EntryList', [])
-            plistService.send_plist({'Command': 'Hangup'})
+            yield plistService
+            plistService.sendall(_HANGUP_PLIST)
         finally:
             self.stopSecureService(imageMounterService)
-        return images
 
-    def lookupImage(self, imageType):
-        signature = None
-        imageMounterService = self.startSecureService('com.apple.mobile.mobile_image_mounter')
-        try:
-            plistService = SecurePlistService(imageMounterService)
-            plistService.send_plist({
-                'Command': 'LookupImage',
-                'ImageType': imageType
-            })
-            result = plistService.recv_plist()
-            signature = result.get('ImageSignature', [])
-            if isinstance(signature, list):
-                if len(signature) > 0:
-                    signature = signature[0]
-                else:
-                    signature = None
-
-            plistService.send_plist({'Command': 'Hangup'})
-        finally:
-            self.stopSecureService(imageMounterService)
+    def _listImages(self, plistService):
+        plistService.sendall(_COPY_DEVICES_PLIST)
+        result = plistService.recv_plist()
+        if result.get('Status') == 'Complete':
+            return result.get('EntryList', [])
+        return []
+
+    def _lookupImage(self, plistService, imageType):
+        plistService.send_plist({
+            'Command': 'LookupImage',
+            'ImageType': imageType
+        })
+        result = plistService.recv_plist()
+        signature = result.get('ImageSignature', [])
+        if isinstance(signature, list):
+            if len(signature) > 0:
+                signature = signature[0]
+            else:
+                signature = None
         return signature
 
+    def listImages(self):
+        with self._imageMounter() as plistService:
+            return self._listImages(plistService)
+
+    def lookupImage(self, imageType):
+        with self._imageMounter() as plistService:
+            return self._lookupImage(plistService, imageType)
+
     def isDeveloperImageMounted(self):
         return self.lookupImage('Developer') is not None
 
     def unmountImage(self):
-        images = self.listImages()
-        for image in images:
-            if image.get('DiskImageType', '')  == 'Developer':
-                imageSignature = image.get('ImageSignature', '')
-                mountPath = image.get('MountPath', '')
-                imageMounterService = self.startSecureService('com.apple.mobile.mobile_image_mounter')
-                try:
-                    plistService = SecurePlistService(imageMounterService)
+        with self._imageMounter() as plistService:
+            for image in self._listImages(plistService):
+                if image.get('DiskImageType', '')  == 'Developer':
                     plistService.send_plist({
                         'Command': 'UnmountImage',
                         'ImageType': 'Developer',
-                        'MountPath': mountPath,
-                        'ImageSignature': imageSignature
+                        'MountPath': image.get('MountPath', ''),
+                        'ImageSignature': image.get('ImageSignature', '')
                     })
                     response = plistService.recv_plist()
                     error = response.get('Error')
                     if error:
                         print("UnmountImage returned: {}".format(error))
-                    plistService.send_plist({'Command': 'Hangup'})
-                finally:
-                    self.stopSecureService(imageMounterService)
 
     def mountImage(self, imagePath):
         imageSignature = Path(Path(imagePath).with_suffix('.dmg.signature')).read_bytes()
-        mountedSignature = self.lookupImage('Developer')
-        if mountedSignature == imageSignature:
-            print('MountImage => AlreadyMounted')
-            return
 
-        imageMounterService = self.startSecureService('com.apple.mobile.mobile_image_mounter')
-        try:
-            plistService = SecurePlistService(imageMounterService)
+        with self._imageMounter() as plistService:
+            mountedSignature = self._lookupImage(plistService, 'Developer')
+            if mountedSignature == imageSignature:
+                print('MountImage => AlreadyMounted')
+                return
 
             plistService.send_plist({
                 'Command': 'ReceiveBytes',
@@ -1012,8 +1313,15 @@ class MobileDeviceManager(object):
             if result.get('Status') != 'ReceiveBytesAck':
                 raise RuntimeError('Expected "ReceiveBytesAck", got {}'.format(result))
 
-            # Send the image to the device
-            plistService.sendall(open(imagePath, 'rb').read())
+            # Stream the image to the device rather than loading it all into memory
+            with open(imagePath, 'rb', buffering=0) as image:
+                chunk = bytearray(1 << 20)
+                view = memoryview(chunk)
+                while True:
+                    length = image.readinto(chunk)
+                    if not length:
+                        break
+                    plistService.sendall(view[:length])
             result = plistService.recv_plist()
             if result.get('Status') != 'Complete':
                 raise RuntimeError('Expected "Complete", got {}'.format(result))
@@ -1030,106 +1338,67 @@ class MobileDeviceManager(object):
             if 'Status' in result:
                 print('MountImage =>', result['Status'])
 
-            plistService.send_plist({'Command': 'Hangup'})
-
-        finally:
-            self.stopSecureService(imageMounterService)
-
     def startService(self, service):
-        self.connect()
-        try:
-            self.startSession()
-            try:
-                fd = ctypes.c_int()
-                e = AMDeviceStartService(self._device, CFStr(service), ctypes.byref(fd), None)
-                if e != 0:
-                    raise MobileDeviceError(e)
-                return fd.value
-            finally:
-                self.stopSession()
-        finally:
-            self.disconnect()
+        with self.session():
+            self._fd.value = 0
+            e = AMDeviceStartService(self._device, CFStr(service), self._fdRef, None)
+            if e != 0:
+                raise MobileDeviceError(e)
+            return self._fd.value
 
     def startHouseArrestService(self, bundleId):
-        self.connect()
-        try:
-            self.startSession()
-            try:
-                fd = ctypes.c_int()
-                e = AMDeviceStartHouseArrestService(self._device, CFStr(bundleId), None, ctypes.byref(fd), None)
-                if e != 0:
-                    raise MobileDeviceError(e)
-                return fd.value
-            finally:
-                self.stopSession()
-        finally:
-            self.disconnect()
+        with self.session():
+            self._fd.value = 0
+            e = AMDeviceStartHouseArrestService(self._device, CFStr(bundleId), None, self._fdRef, None)
+            if e != 0:
+                raise MobileDeviceError(e)
+            return self._fd.value
 
     def startSecureService(self, service):
-        self.connect()
-        try:
-            self.startSession()
-            try:
-                handle = ctypes.c_void_p()
-                e = AMDeviceSecureStartService(self._device, CFStr(service), None, ctypes.byref(handle))
-                if e != 0:
-                    raise MobileDeviceError(e)
-                return handle
-            finally:
-                self.stopSession()
-        finally:
-            self.disconnect()
+        with self.session():
+            handle = ctypes.c_void_p()
+            e = AMDeviceSecureStartService(self._device, CFStr(service), None, ctypes.byref(handle))
+            if e != 0:
+                raise MobileDeviceError(e)
+            return handle
 
     def stopSecureService(self, handle):
         if handle:
-            self.connect()
-            self.startSession()
             AMDServiceConnectionInvalidate(handle)
-            self.stopSession()
-            self.disconnect()
 
     def readPlist(self, path):
         plist = {}
         try:
-            f = open(path, 'rb')
-            plist = plistlib.load(f)
-            f.close()
+            plist = _read_plist_file(path, os.stat(path).st_mtime_ns)
         except:
             raise RuntimeError('Unable to load plist: {}'.format(path))
         return plist
 
     def bundleId(self, path):
-        plist = self.readPlist(os.path.join(path, 'Info.plist'))
+        plist = self.readPlist(_app_bundle(path).infoPlist)
         return plist['CFBundleIdentifier']
 
     def bundleExecutable(self, path):
-        plist = self.readPlist(os.path.join(path, 'Info.plist'))
+        plist = self.readPlist(_app_bundle(path).infoPlist)
         return plist['CFBundleExecutable']
 
     def transferApplication(self, path):
         afc = self.startService("com.apple.afc")
         try:
-            e = AMDeviceTransferApplication(afc, CFStr(os.path.abspath(path)), None, self._transferCallback, None)
+            e = AMDeviceTransferApplication(afc, CFStr(_app_bundle(path).path), None, self._transferCallback, None)
             if e != 0:
                 raise MobileDeviceError(e)
         finally:
             self.stopService(afc)
 
     def installApplication(self, path):
-        afc = mdm.startService("com.apple.mobile.installation_proxy")
+        afc = self.startService("com.apple.mobile.installation_proxy")
         try:
-
-            items = 1
-            keys = (ctypes.c_void_p * items)(CFStr('PackageType'))
-            values = (ctypes.c_void_p * items)(CFStr('Developer'))
-
-            options = CFDictionaryCreate(None, keys, values, items, ctypes.byref(kCFTypeDictionaryKeyCallBacks), ctypes.byref(kCFTypeDictionaryValueCallBacks))
-
-            e = AMDeviceInstallApplication(afc, CFStr(path), options, self._installCallback, None)
+            e = AMDeviceInstallApplication(afc, CFStr(path), _INSTALL_OPTIONS, self._installCallback, None)
             if e != 0:
                 raise MobileDeviceError(e)
         finally:
-            mdm.stopService(afc)
+            self.stopService(afc)
 
     def uninstallApplication(self, bundleId):
         afc = self.startService("com.apple.mobile.installation_proxy")
@@ -1140,22 +1409,13 @@ class MobileDeviceManager(object):
         finally:
             self.stopService(afc)
 
-        items = 1
-
     def lookupApplications(self):
-        self.connect()
-        try:
-            self.startSession()
-            try:
-                dictionary = CFDictionaryRef()
-                e = AMDeviceLookupApplications(self._device, 0, ctypes.byref(dictionary))
-                if e != 0:
-                    raise MobileDeviceError(e)
-                return CFDictionaryToDict(dictionary)
-            finally:
-                self.stopSession()
-        finally:
-            self.disconnect()
+        with self.session():
+            self._dictionary.value = None
+            e = AMDeviceLookupApplications(self._device, 0, self._dictionaryRef)
+            if e != 0:
+                raise MobileDeviceError(e)
+            return CFDictionaryToDict(self._dictionary)
 
     def lookupApplicationExecutable(self, identifier):
         dictionary = self.lookupApplications()
@@ -1170,20 +1430,26 @@ class MobileDeviceManager(object):
         else:
             os.close(fd)
 
-    def showStatus(self, action, dictionary):
-        show = ['[{}]'.format(action)]
-
-        percentComplete = CFDictionaryGetValue(dictionary, CFStr('PercentComplete'))
+    def showStatus(self, action, dictionary,
+                   _getValue=CFDictionaryGetValue, _getStr=CFStringGetStr,
+                   _percentKey=_CFSTR_PERCENT_COMPLETE, _statusKey=_CFSTR_STATUS, _pathKey=_CFSTR_PATH):
+        percent = None
+        percentComplete = _getValue(dictionary, _percentKey)
         if percentComplete:
-            percent = ctypes.c_int()
-            CFNumberGetValue(percentComplete, kCFNumberSInt32Type, ctypes.byref(percent))
-            show.append(str.rjust('{}%'.format(percent.value), 4))
+            value = ctypes.c_int()
+            CFNumberGetValue(percentComplete, kCFNumberSInt32Type, ctypes.byref(value))
+            percent = value.value
+        statusRef = _getValue(dictionary, _statusKey)
+        path = _getValue(dictionary, _pathKey)
 
-        show.append(CFStringGetStr(CFDictionaryGetValue(dictionary, CFStr('Status'))))
+        show = ['[{}]'.format(action)]
+        if percent is not None:
+            show.append('{:>3}%'.format(percent))
+
+        show.append(_getStr(statusRef))
 
-        path = CFDictionaryGetValue(dictionary, CFStr('Path'))
         if path:
-            show.append(CFStringGetStr(path))
+            show.append(_getStr(path))
 
         status = ' '.join(show)
         if self._last_status != status:
@@ -1192,6 +1458,7 @@ class MobileDeviceManager(object):
 
     def debugServer(self):
         service = self.startSecureService('com.apple.debugserver.DVTSecureSocketProxy')
+        _set_tcp_nodelay(AMDServiceConnectionGetSocket(service))
         return service
 
     def _timer(self, timer, info):
@@ -1257,14 +1524,32 @@ class AFCFile(object):
         result = AFCFileRefRead(self._afc, self._file, data, ctypes.byref(readLength))
         if result != 0:
             raise RuntimeError('AFCFileRefRead returned %d' % result)
-        return data.raw[:readLength.value]
+        return bytes(memoryview(data)[:readLength.value])
+
+    def readinto(self, buffer):
+        """
+        Reads directly into a writable buffer such as a bytearray and returns the
+        number of bytes read.
+        """
+        readLength = ctypes.c_uint32(len(buffer))
+        data = (ctypes.c_char * len(buffer)).from_buffer(buffer)
+        result = AFCFileRefRead(self._afc, self._file, data, ctypes.byref(readLength))
+        if result != 0:
+            raise RuntimeError('AFCFileRefRead returned %d' % result)
+        return readLength.value
 
     def write(self, data):
-        length = ctypes.c_uint(len(data))
         pointer = ctypes.c_char_p(data)
-        result = AFCFileRefWrite(self._afc, self._file, pointer, length)
-        if result != 0:
-            raise RuntimeError('AFCFileRefWrite returned %d' % result)
+        address = ctypes.cast(pointer, ctypes.c_void_p).value
+        offset = 0
+        while offset < len(data):
+            length = min(len(data) - offset, AFC_CHUNK_SIZE)
+            result = AFCFileRefWrite(self._afc, self._file, address + offset, length)
+            if result != 0:
+                raise RuntimeError('AFCFileRefWrite returned %d' % result)
+            offset += length
+
+_DOT_ENTRIES = frozenset(('.', '..'))
 
 class AFC(object):
     def __init__(self, session):
@@ -1291,16 +1576,24 @@ class AFC(object):
         if result != 0:
             raise OSError('AFCDirectoryOpen returned %d' % result)
         name = ctypes.c_char_p()
+        nameRef = ctypes.byref(name)
         entries = []
-        while AFCDirectoryRead(self._afc, directory, ctypes.byref(name)) == 0:
-            if name.value is None:
+        append = entries.append
+        read = AFCDirectoryRead
+        while read(self._afc, directory, nameRef) == 0:
+            value = name.value
+            if value is None:
                 break
-            path = name.value.decode('utf-8')
-            if not path in ('.', '..'):
-                entries.append(path)
+            path = value.decode('utf-8')
+            if path not in _DOT_ENTRIES:
+                append(path)
         AFCDirectoryClose(self._afc, directory)
         return entries
 
+@functools.lru_cache(maxsize=1)
+def _xcode_select_path():
+    return subprocess.check_output(['xcode-select', '-print-path']).decode('utf-8').strip()
+
 class DeviceSupportPaths(object):
     """
     A small helper for finding various Xcode directories.
@@ -1317,6 +1610,7 @@ class DeviceSupportPaths(object):
         self._deviceSupportDirectory = None
         self._deviceSupportForOsVersion = None
         self._developerDiskImagePath = None
+        self._versionPermutations = None
 
     def deviceSupportDirectory(self):
         if not self._deviceSupportDirectory:
@@ -1324,7 +1618,7 @@ class DeviceSupportPaths(object):
                 here = os.path.normpath(os.path.abspath(os.path.dirname(__file__)))
                 self._deviceSupportDirectory = os.path.join(here, 'DeveloperDiskImage')
             else:
-                self._deviceSupportDirectory = subprocess.check_output(['xcode-select', '-print-path']).decode('utf-8').strip()
+                self._deviceSupportDirectory = os.environ.get('DEVELOPER_DIR') or _xcode_select_path()
         return self._deviceSupportDirectory
 
     def deviceSupportDirectoryForOsVersion(self):
@@ -1342,16 +1636,23 @@ class DeviceSupportPaths(object):
         return self._deviceSupportForOsVersion
 
     def versionPermutations(self):
+        if not self._versionPermutations:
             shortProductVersion = '.'.join(self._productVersion.split('.')[:2])
-            return [
+            self._versionPermutations = [
                 '%s (%s)' % (self._productVersion, self._buildVersion),
                 '%s (%s)' % (shortProductVersion, self._buildVersion),
                 '%s' % self._productVersion,
                 '%s' % shortProductVersion,
                 'Latest',
             ]
+        return self._versionPermutations
 
     def developerDiskImagePath(self):
+        if not self._developerDiskImagePath and self._deviceSupportForOsVersion:
+            # The version directory has already been found, so try it first.
+            attempt = os.path.join(self._deviceSupportForOsVersion, 'DeveloperDiskImage.dmg')
+            if os.path.exists(attempt):
+                self._developerDiskImagePath = attempt
         if not self._developerDiskImagePath:
             if sys.platform == 'win32':
                 path = self.deviceSupportDirectory()
@@ -1374,6 +1675,56 @@ class DebuggerException(Exception):
     def __str__(self):
         return '{}'.format(self.value)
 
+def _expand_runs(payload):
+    """
+    Expands run-length encoded packet data, where 'x*n' stands for x followed
+    by ord(n) - 29 more copies of x.
+    """
+    expanded = bytearray()
+    start = 0
+    index = payload.find(b'*')
+    while index != -1:
+        expanded += payload[start:index]
+        expanded += payload[index - 1:index] * (payload[index + 1] - 29)
+        start = index + 2
+        index = payload.find(b'*', start)
+    expanded += payload[start:]
+    return bytes(expanded)
+
+def _parse_frames(buffer, scanFrom, append):
+    """
+    Removes every complete GDB remote protocol packet from the front of buffer,
+    passing each payload to append, and returns how far the remaining partial
+    packet has already been searched for its terminator.
+    """
+    find = buffer.find
+    while True:
+        startIndex = find(b'$')
+        if startIndex == -1:
+            # Only ACKs; we trust we're on a reliable connection.
+            del buffer[:]
+            return 0
+        endIndex = find(b'#', max(scanFrom, startIndex + 1))
+        if endIndex == -1 or len(buffer) < endIndex + 3:
+            # Keep the partial packet and remember how far it has been
+            # searched, so a long packet isn't rescanned on every recv.
+            del buffer[:startIndex]
+            return len(buffer) if endIndex == -1 else endIndex - startIndex
+
+        payload = bytes(buffer[startIndex + 1:endIndex])
+        checksum = bytes(buffer[endIndex + 1:endIndex + 3]).decode('utf-8')
+        if checksum != '00':
+            calculated = '%02x' % (sum(payload) & 255)
+            if checksum != calculated:
+                raise RuntimeError('Bad response checksum (%s vs %s).' % (checksum, calculated))
+
+        if b'*' in payload:
+            payload = _expand_runs(payload)
+
+        del buffer[:endIndex + 3]
+        scanFrom = 0
+        append(payload.decode('utf-8'))
+
 class GdbServer(object):
     """
     Given a handle to the iOS remote debugserver service, this speaks just enough
@@ -1384,81 +1735,80 @@ class GdbServer(object):
     Usage:
         GdbServer(connectedSocket).run('/path/to/executable', 'arg1', 'arg2')
     """
+    _packLength = struct.Struct('>L').pack
+    _HEX = tuple(b'%02x' % i for i in range(256))
+    _ACK = _packLength(1) + b'+'
+    _STOP_REPLY_COMMANDS = ('C', 'c', 'S', 's', 'vCont', 'vAttach', 'vRun', 'vStopped', '?')
+
     def __init__(self, serviceConnection):
         self._connection = serviceConnection
         self._service = SecureService(serviceConnection)
         self.exitCode = None
-        self._readBuffer = ''
+        self._readBuffer = bytearray()
+        self._scanFrom = 0
+        self._packets = collections.deque()
+        self._noAck = False
+        # Output characters may be split across 'O' packets.
+        self._outputDecoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
 
     def read(self):
-        startIndex = self._readBuffer.find('$')
-        endIndex = self._readBuffer.find('#', startIndex)
-        while startIndex == -1 or endIndex == -1 or len(self._readBuffer) < endIndex + 3:
-            data = self._service.recv(4096)
+        packets = self._packets
+        while not packets:
+            data = self._service.recv(65536)
             if not data:
-                break
-            self._readBuffer += data.decode('utf-8')
-            startIndex = self._readBuffer.find('$')
-            endIndex = self._readBuffer.find('#', startIndex)
-
-        # Discard any ACKs.  We trust we're on a reliable connection.
-        while self._readBuffer.startswith('+'):
-            self._readBuffer = self._readBuffer[1:]
-
-        payload = None
-        startIndex = self._readBuffer.find('$')
-        endIndex = self._readBuffer.find('#', startIndex)
-        if startIndex != -1 and endIndex != -1 and len(self._readBuffer) >= endIndex + 3:
-            payload = self._readBuffer[startIndex + 1:endIndex]
-            checksum = self._readBuffer[endIndex + 1:endIndex + 3]
-            if checksum != '00':
-                calculated = '%02x' % (sum(ord(c) for c in payload) & 255)
-                if checksum != calculated:
-                    raise RuntimeError('Bad response checksum (%s vs %s).' % (checksum, calculated))
+                return None
+            self._readBuffer.extend(data)
+            self._scanFrom = _parse_frames(self._readBuffer, self._scanFrom, packets.append)
+        if not self._noAck:
+            self._service.sendall(self._ACK)
+        return packets.popleft()
 
-        self._readBuffer = self._readBuffer[endIndex + 3:]
-
-        return payload
+    def _frame(self, packet):
+        packet = packet.encode('utf-8')
+        return b''.join((self._packLength(len(packet) + 4), b'$', packet, b'#', self._HEX[sum(packet) & 255]))
 
     def _send(self, packet):
-        payload = '$%s#%02x' % (packet, sum(ord(c) for c in packet) & 255)
-        message = struct.pack('>L', len(payload)) + bytes(payload, 'utf-8')
-        self._service.sendall(message)
+        self._service.sendall(self._frame(packet))
+
+    def sendPipelined(self, *packets):
+        """
+        Sends packets that don't produce stop replies back to back, then reads
+        their responses in order.
+        """
+        self._service.sendall(b''.join(self._frame(packet) for packet in packets))
+        return [self.read() for packet in packets]
 
     def send(self, packet):
         self._send(packet)
 
-        stopReply = [True for command in ['C', 'c', 'S', 's', 'vCont', 'vAttach', 'vRun', 'vStopped', '?'] if packet.startswith(command)]
-
-        if stopReply:
+        if packet.startswith(self._STOP_REPLY_COMMANDS):
             resume = True
             while resume:
                 resume = False
                 response = self.read()
                 if response:
-                    if response.startswith('S'):
-                        signal = '0x' + response[1:3]
-                        message = 'Program received signal %s.' % signal
+                    kind = response[0]
+                    if kind in 'STX':
+                        signal = int(response[1:3], 16)
+                    if kind == 'S':
+                        message = 'Program received signal 0x%02x.' % signal
                         raise DebuggerException(message)
-                    elif response.startswith('T'):
-                        signal = '0x' + response[1:3]
-                        message = 'Program received signal %s.' % signal
-                        for pair in response[4:].split(';'):
+                    elif kind == 'T':
+                        message = 'Program received signal 0x%02x.' % signal
+                        for pair in response[3:].rstrip(';').split(';'):
                             message += '\n%s' % pair
                         raise DebuggerException(message)
-                    elif response.startswith('W'):
-                        self.exitCode = int(response[1:], 16)
+                    elif kind == 'W':
+                        self.exitCode = int(response[1:3], 16)
                         print('Process returned %d.' % self.exitCode)
-                    elif response.startswith('X'):
-                        signal = '0x' + response[1:3]
+                    elif kind == 'X':
                         if ';' in response:
                             response = response.split(';', 1)[1]
-                        raise DebuggerException('Process terminated with signal %s (%s).' % (signal, response))
-                    elif response.startswith('O'):
-                        log_output = binascii.unhexlify(bytes(response[1:],'utf-8')).decode('utf-8')
-                        print('{}'.format(log_output), end=' ')
+                        raise DebuggerException('Process terminated with signal 0x%02x (%s).' % (signal, response))
+                    elif kind == 'O':
+                        sys.stdout.write(self._outputDecoder.decode(bytes.fromhex(response[1:])))
                         resume = True
-                    elif response.startswith('F'):
+                    elif kind == 'F':
                         raise RuntimeError('GDB File-I/O Remote Protocol Unimplemented.')
                     else:
                         raise RuntimeError('Unexpected response to stop reply packet: ' + response)
@@ -1467,15 +1817,13 @@ class GdbServer(object):
         return response
 
     def run(self, *argv):
-        self.send('QStartNoAckMode')
-        self._send('+')
-        self.send('QEnvironmentHexEncoded:')
-        self.send('QSetDisableASLR:1')
-        args_command = 'A'
-        for i,arg in enumerate(argv):
-            args_command += '{},{},{},'.format(len(arg) * 2, i, binascii.hexlify(bytes(arg, 'utf-8')).decode('utf-8'))
-        self.send(args_command)
-        self.send('qLaunchSuccess')
+        if self.send('QStartNoAckMode') == 'OK':
+            self._noAck = True
+        args = []
+        for i, arg in enumerate(argv):
+            arg = arg.encode('utf-8')
+            args.append(b'%d,%d,%s' % (len(arg) * 2, i, binascii.hexlify(arg)))
+        self.sendPipelined('QSetDisableASLR:1', 'A' + b','.join(args).decode('ascii'), 'qLaunchSuccess')
         self.send('vCont;c')
 
 if __name__ == '__main__':
@@ -1535,8 +1883,9 @@ if __name__ == '__main__':
 
     if arguments.install:
         print('\nInstalling %s...' % arguments.bundle)
-        mdm.transferApplication(arguments.bundle)
-        mdm.installApplication(arguments.bundle)
+        with mdm.session():
+            mdm.transferApplication(arguments.bundle)
+            mdm.installApplication(arguments.bundle)
 
     if arguments.list_applications:
         print('\nInstalled applications:')
@@ -1547,16 +1896,18 @@ if __name__ == '__main__':
             print(bundleId)
 
     if arguments.mount:
-        if arguments.developer_disk_image:
-            ddi = arguments.developer_disk_image
-        else:
-            ddi = DeviceSupportPaths('iPhoneOS', mdm.productVersion(), mdm.buildVersion()).developerDiskImagePath()
-        print('\nMounting %s...' % ddi)
-        mdm.mountImage(ddi)
+        with mdm.session():
+            if arguments.developer_disk_image:
+                ddi = arguments.developer_disk_image
+            else:
+                ddi = DeviceSupportPaths('iPhoneOS', mdm.productVersion(), mdm.buildVersion()).developerDiskImagePath()
+            print('\nMounting %s...' % ddi)
+            mdm.mountImage(ddi)
 
     if arguments.run:
-        executable = mdm.lookupApplicationExecutable(arguments.appid or mdm.bundleId(arguments.bundle))
-        db = mdm.debugServer()
+        with mdm.session():
+            executable = mdm.lookupApplicationExecutable(arguments.appid or mdm.bundleId(arguments.bundle))
+            db = mdm.debugServer()
         #if arguments.timeout > 0:
         #    db.settimeout(arguments.timeout)
         debugger = GdbServer(db)
@@ -1580,40 +1931,32 @@ if __name__ == '__main__':
         if arguments.get_file:
             readFile = afc.open(arguments.get_file[0], 'r')
             writeFile = open(arguments.get_file[1], 'wb')
-            size = 0
-            while True:
-                data = readFile.read(8192)
-                if not data:
-                    break
-                writeFile.write(data)
-                size += len(data)
+            shutil.copyfileobj(readFile, writeFile, AFC_CHUNK_SIZE)
+            size = writeFile.tell()
             writeFile.close()
             readFile.close()
             print('%d bytes read from %s.' % (size, arguments.get_file[0]))
         elif arguments.put_file:
             readFile = open(arguments.put_file[0], 'rb')
             writeFile = afc.open(arguments.put_file[1], 'w')
-            size = 0
-            while True:
-                data = readFile.read(8192)
-                if not data:
-                    break
-                writeFile.write(data)
-                size += len(data)
+            shutil.copyfileobj(readFile, writeFile, AFC_CHUNK_SIZE)
+            size = readFile.tell()
             writeFile.close()
             readFile.close()
             print('%d bytes written to %s.' % (size, arguments.put_file[1]))
         elif arguments.list_files:
             print('Listing %s:' % arguments.list_files)
-            def walk(root, indent=0):
+            stack = [(arguments.list_files, 0)]
+            while stack:
+                root, indent = stack.pop()
                 print('  ' * indent + root)
                 try:
                     children = afc.listdir(root)
                 except:
                     children = []
-                for child in children:
-                    walk(root.rstrip('/') + '/' + child, indent + 1)
-            walk(arguments.list_files)
+                prefix = root.rstrip('/') + '/'
+                # Pushed in reverse so they come off the stack in sorted order.
+                stack.extend((prefix + child, indent + 1) for child in sorted(children, reverse=True))
         afc.close()
 
     mdm.close()